@@ -0,0 +1,209 @@
+"""
+micro-benchmark of the feed parsing on the fixed pages of benchmarks/corpus.
+
+    python benchmarks/bench_parser.py -o before.json
+    python benchmarks/bench_parser.py --compare before.json
+
+every case is timed on every page, the best of --repeat runs is kept,
+the peak of the allocated memory is measured by tracemalloc in a separate run.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, get_args
+from xml.dom import minidom
+from xml.etree import ElementTree
+
+sys.path.insert(0, str(Path(__file__).parents[1]))
+# keep the configs of this checkout untouched
+os.environ.setdefault("TRANS_RSS_CONFIG", tempfile.mkdtemp(prefix="trans-rss-bench-"))
+os.environ.setdefault("TRANS_RSS_LOGS", os.path.join(os.environ["TRANS_RSS_CONFIG"], "logs"))
+
+from trans_rss import subscribe_types  # noqa: E402
+from trans_rss.actions import CHUNK_SIZE, iter_rss  # noqa: E402
+from trans_rss.config import version  # noqa: E402
+
+try:
+    from lxml import etree as lxml_etree
+except ImportError:
+    lxml_etree = None
+
+corpus_dir = Path(__file__).parent / "corpus"
+
+
+def _chunks(content: bytes):
+    return [content[i:i + CHUNK_SIZE] for i in range(0, len(content), CHUNK_SIZE)]
+
+
+def _interpret(node, path: list, default):
+    """
+    the streamed items walked along the path at every call, the baseline of the compiled extractor
+    """
+    if not path:
+        return default
+    match path.pop():
+        case "Node", tag:
+            for child in node:
+                if child.tag == tag:
+                    return _interpret(child, path, default)
+            return default
+        case "Attr", attr:
+            return node.get(attr, default)
+        case "XML", _:
+            return "".join(subscribe_types.iter_stream_xml(node)).strip()
+        case "Plain", _:
+            return "".join(node.itertext()).strip()
+
+
+def _interpret_texts(st: subscribe_types.SubscribeType, node, default="未找到"):
+    return {key: _interpret(node, list(reversed(st.get_path(key))), default) for key in get_args(subscribe_types.Keys)}
+
+
+def _minidom_items(content: bytes):
+    return minidom.parseString(content).getElementsByTagName("item")
+
+
+def _etree_texts(root, enclosure: bool):
+    """
+    the same fields as the builtin templates, with the find of an element tree
+    """
+    count = 0
+    for item in root.iter("item"):
+        texts = {
+            "title": "".join(item.find("title").itertext()),
+            "gui": "".join(item.find("guid").itertext()),
+            "description": "".join(item.find("description").itertext()),
+        }
+        if enclosure:
+            texts["torrent"] = item.find("enclosure").get("url")
+        else:
+            texts["torrent"] = "".join(item.find("link").itertext())
+        count += 1
+    return count
+
+
+def cases(hostname: str, content: bytes) -> Dict[str, Callable[[], int]]:
+    """
+    the functions to time, each parses the whole page and returns the number of items
+    """
+    st = subscribe_types.get(hostname)
+    chunks = _chunks(content)
+    enclosure = st.get_path("torrent")[0] == ("Node", "enclosure")
+    items = _minidom_items(content)
+
+    def plain_all():
+        count = 0
+        for item in items:
+            for node, _ in subscribe_types.iter_node(item):
+                "".join(subscribe_types.iter_plain(node))
+            count += 1
+        return count
+
+    result = {
+        "iter_rss": lambda: sum(1 for _ in iter_rss(hostname, content)),
+        "iter_rss chunked": lambda: sum(1 for _ in iter_rss(hostname, chunks)),
+        "iter_items": lambda: sum(1 for _ in subscribe_types.iter_items(chunks)),
+        "stream_get_texts": lambda: sum(
+            1 for item in subscribe_types.iter_items(chunks) if _interpret_texts(st, item)),
+        "minidom parse": lambda: len(_minidom_items(content)),
+        "minidom get_texts": lambda: sum(1 for item in _minidom_items(content) if st.get_texts(item)),
+        "get_text title": lambda: sum(1 for item in items if st.get_text(item, "title")),
+        "iter_node iter_plain": plain_all,
+        "etree": lambda: _etree_texts(ElementTree.fromstring(content), enclosure),
+    }
+    if lxml_etree is not None:
+        result["lxml"] = lambda: _etree_texts(lxml_etree.fromstring(content), enclosure)
+    return result
+
+
+def measure(func: Callable[[], int], repeat: int, min_seconds: float):
+    """
+    items per second of the best run, and the peak of the allocated memory
+    """
+    items = func()  # warm up, and the templates are compiled
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        if time.perf_counter() - start >= min_seconds:
+            break
+        number *= 2
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - start) / number)
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "items": items,
+        "seconds": best,
+        "items_per_second": round(items / best, 1),
+        "peak_kb": round(peak / 1024, 1),
+    }
+
+
+def run(repeat: int, min_seconds: float, selected: List[str]):
+    results = []
+    for file in sorted(corpus_dir.glob("*.xml")):
+        hostname = file.name.split("--")[0]
+        content = file.read_bytes()
+        for case, func in cases(hostname, content).items():
+            if selected and case not in selected:
+                continue
+            result = measure(func, repeat, min_seconds)
+            results.append({"corpus": file.name, "bytes": len(content), "case": case, **result})
+            print(
+                f"{file.name:<28} {case:<22} {result['items_per_second']:>12.0f} items/s {result['peak_kb']:>9.1f} KB",
+                file=sys.stderr)
+    return {
+        "version": version.strip(),
+        "python": platform.python_version(),
+        "lxml": lxml_etree is not None,
+        "results": results,
+    }
+
+
+def compare(base, current):
+    old = {(r["corpus"], r["case"]): r for r in base["results"]}
+    print(f"{'corpus':<28} {'case':<22} {'speed':>8} {'memory':>8}   {base['version']} -> {current['version']}")
+    for result in current["results"]:
+        before = old.get((result["corpus"], result["case"]))
+        if before is None:
+            continue
+        speed = result["items_per_second"] / before["items_per_second"]
+        memory = result["peak_kb"] / before["peak_kb"] if before["peak_kb"] else float("nan")
+        print(f"{result['corpus']:<28} {result['case']:<22} {speed:>7.2f}x {memory:>7.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-seconds", type=float, default=0.2, help="the minimum time of a run")
+    parser.add_argument("--case", action="append", default=[], help="only run the cases, can be repeated")
+    parser.add_argument("-o", "--output", help="write the results to the file instead of stdout")
+    parser.add_argument("--compare", help="the results of another version to compare with")
+    args = parser.parse_args()
+
+    results = run(args.repeat, args.min_seconds, args.case)
+    text = json.dumps(results, indent=4, ensure_ascii=False)
+    if args.output:
+        Path(args.output).write_text(text)
+    elif not args.compare:
+        print(text)
+    if args.compare:
+        compare(json.loads(Path(args.compare).read_text()), results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+end-to-end benchmark of actions.update() against the local mock servers.
+
+    python benchmarks/bench_update.py                 # 10, 100 and 1000 subscriptions
+    python benchmarks/bench_update.py -n 100 -o result.json
+
+each size runs in a fresh process with its own config folder (TRANS_RSS_CONFIG), three update cycles:
+  cold    every episode is new and added to transmission
+  release one new episode for every show
+  idle    nothing new, every feed answers 304
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parents[1]))
+sys.path.insert(0, str(Path(__file__).parent))
+
+
+def _post(url: str):
+    with urllib.request.urlopen(urllib.request.Request(url, b"", method="POST"), timeout=10) as resp:
+        return json.loads(resp.read() or b"{}")
+
+
+def _config(feed_port: int, transmission_port: int, log_level: str):
+    return {
+        "transmission": {"host": "127.0.0.1", "port": transmission_port},
+        "without_transmission": False,
+        "auto_start": False,
+        "auto_page": True,
+        "webhooks": [],
+        "http_proxy": f"http://127.0.0.1:{feed_port}",
+        "update_logger_level": log_level,
+        "logger_level": log_level,
+        "config_version": "0.2.1",
+    }
+
+
+def child(subscriptions: int, feed_port: int, transmission_port: int, output: str):
+    """
+    runs in the benchmark process, the config folder is already given by the environment
+    """
+    import feeds
+    from trans_rss import actions
+    from trans_rss.common import http_client
+    from trans_rss.sql import Connection, Subscribe
+
+    with Connection() as conn, conn.batch():
+        for show in range(subscriptions):
+            host = feeds.HOSTS[show % len(feeds.HOSTS)]
+            conn.subscribe(Subscribe(name=f"show {show}", url=feeds.feed_url(host, show)))
+
+    async def cycle():
+        return len([item async for item in actions.update()])
+
+    results = {"subscriptions": subscriptions, "cycles": []}
+    for name in ["cold", "release", "idle"]:
+        if name == "release":
+            _post(f"http://127.0.0.1:{feed_port}/release")
+        _post(f"http://127.0.0.1:{feed_port}/stats")  # reset the counters
+        _post(f"http://127.0.0.1:{transmission_port}/stats")
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        start = time.perf_counter()
+        downloads = asyncio.run(cycle())
+        wall = time.perf_counter() - start
+        end = resource.getrusage(resource.RUSAGE_SELF)
+        results["cycles"].append({
+            "cycle": name,
+            "wall_seconds": round(wall, 3),
+            "cpu_seconds": round(end.ru_utime - usage.ru_utime + end.ru_stime - usage.ru_stime, 3),
+            "downloads": downloads,
+            "requests": _post(f"http://127.0.0.1:{feed_port}/stats"),
+            "rpc": _post(f"http://127.0.0.1:{transmission_port}/stats"),
+        })
+    # kilobytes on linux, bytes on macos
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results["peak_rss_mb"] = round(peak / (1 << 20 if sys.platform == "darwin" else 1 << 10), 1)
+    results["http"] = http_client.stats()["hosts"]
+    Path(output).write_text(json.dumps(results))
+
+
+def run(subscriptions: int, feed_port: int, transmission_port: int, log_level: str, verbose: bool):
+    with tempfile.TemporaryDirectory(prefix="trans-rss-bench-") as folder:
+        config_dir = Path(folder) / "configs"
+        config_dir.mkdir()
+        (config_dir / "config.json").write_text(json.dumps(
+            _config(feed_port, transmission_port, log_level)))
+        output = Path(folder) / "result.json"
+        env = dict(os.environ, TRANS_RSS_CONFIG=str(config_dir), TRANS_RSS_LOGS=str(Path(folder) / "logs"))
+        subprocess.run(
+            [sys.executable, __file__, "--child", str(subscriptions),
+             "--ports", str(feed_port), str(transmission_port), "-o", str(output)],
+            env=env, check=True,
+            stdout=None if verbose else subprocess.DEVNULL,
+            stderr=None if verbose else subprocess.DEVNULL)
+        return json.loads(output.read_text())
+
+
+def report(results):
+    print(f"{'subs':>6} {'cycle':>8} {'wall s':>8} {'cpu s':>8} {'feeds':>6} {'torrents':>8} {'rpc':>6} {'added':>6} {'rss MB':>7}")
+    for result in results:
+        for cycle in result["cycles"]:
+            print(
+                f"{result['subscriptions']:>6} {cycle['cycle']:>8} {cycle['wall_seconds']:>8.2f} {cycle['cpu_seconds']:>8.2f}"
+                f" {cycle['requests'].get('feed', 0):>6} {cycle['requests'].get('torrent', 0):>8}"
+                f" {sum(cycle['rpc'].values()):>6} {cycle['downloads']:>6} {result['peak_rss_mb']:>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--subscriptions", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--episodes", type=int, default=12, help="episodes of each show before the release")
+    parser.add_argument("--per-page", type=int, default=10)
+    parser.add_argument("--log-level", default="WARN")
+    parser.add_argument("-o", "--output", help="write the results as json")
+    parser.add_argument("-v", "--verbose", action="store_true", help="show the output of the benchmark processes")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--ports", type=int, nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        child(args.child, *args.ports, args.output)
+        return
+
+    import mock_servers
+    results = []
+    for subscriptions in args.subscriptions:
+        # fresh servers, the transmission of the last size knows every torrent
+        feed_server = mock_servers.MockFeeds(args.episodes, args.per_page)
+        transmission = mock_servers.MockTransmission()
+        mock_servers.start(feed_server, transmission)
+        try:
+            results.append(run(subscriptions, feed_server.port, transmission.port, args.log_level, args.verbose))
+        finally:
+            feed_server.server.shutdown()
+            transmission.server.shutdown()
+    report(results)
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=4))
+
+
+if __name__ == "__main__":
+    main()
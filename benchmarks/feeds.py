@@ -0,0 +1,134 @@
+"""
+synthetic feeds shaped like the builtin subscribe types, nyaa.si, acg.rip and www.kisssub.org
+"""
+import hashlib
+from datetime import datetime, timedelta
+from html import escape
+from typing import Callable, Dict, List, Tuple
+
+HOSTS = ["nyaa.si", "acg.rip", "www.kisssub.org"]
+
+_EPOCH = datetime(2023, 1, 1, 12)
+_GROUPS = ["SubsPlease", "Erai-raws", "ANi", "LoliHouse", "NC-Raws", "桜都字幕组", "喵萌奶茶屋"]
+
+
+def feed_url(host: str, show: int):
+    """
+    the url of the search feed of a show, the same show is always on the same host in the benchmarks
+    """
+    match host:
+        case "nyaa.si":
+            return f"http://nyaa.si/?page=rss&q=show+{show}"
+        case "acg.rip":
+            return f"http://acg.rip/.xml?term=show{show}"
+        case _:
+            return f"http://www.kisssub.org/rss-show{show}.xml"
+
+
+def item_id(show: int, episode: int):
+    return show * 10000 + episode
+
+
+def title(show: int, episode: int):
+    group = _GROUPS[show % len(_GROUPS)]
+    return f"[{group}] Show {show} 第{episode}话 - {episode:02d} [1080p][HEVC][简繁内封]"
+
+
+def info_hash(show: int, episode: int):
+    return hashlib.sha1(f"{show}-{episode}".encode()).hexdigest()
+
+
+def torrent(show: int, episode: int):
+    """
+    a small but valid torrent file, unique for each episode
+    """
+    name = title(show, episode).encode()
+    pieces = hashlib.sha1(name).digest()
+    announce = b"http://tracker.example/announce"
+    return (
+        f"d8:announce{len(announce)}:".encode() + announce + b"4:infod"
+        b"6:lengthi1073741824e"
+        + f"4:name{len(name)}:".encode() + name
+        + b"12:piece lengthi1048576e"
+        + f"6:pieces{len(pieces)}:".encode() + pieces
+        + b"ee")
+
+
+def _date(episode: int):
+    return (_EPOCH + timedelta(days=7 * episode)).strftime("%a, %d %b %Y %H:%M:%S +0000")
+
+
+def _nyaa_item(show: int, episode: int):
+    i = item_id(show, episode)
+    t = title(show, episode)
+    description = f'<a href="https://nyaa.si/view/{i}">#{i} | {escape(t)}</a> | 1.2 GiB | Anime - Non-English-translated | {info_hash(show, episode).upper()}'
+    return (
+        f"<item><title>{escape(t)}</title>"
+        f"<link>http://nyaa.si/download/{i}.torrent</link>"
+        f'<guid isPermaLink="true">http://nyaa.si/view/{i}</guid>'
+        f"<pubDate>{_date(episode)}</pubDate>"
+        f"<nyaa:seeders>{i % 97}</nyaa:seeders><nyaa:leechers>{i % 13}</nyaa:leechers>"
+        f"<nyaa:downloads>{i % 1009}</nyaa:downloads><nyaa:infoHash>{info_hash(show, episode)}</nyaa:infoHash>"
+        f"<nyaa:categoryId>1_3</nyaa:categoryId><nyaa:category>Anime - Non-English-translated</nyaa:category>"
+        f"<nyaa:size>1.2 GiB</nyaa:size><nyaa:comments>0</nyaa:comments><nyaa:trusted>No</nyaa:trusted><nyaa:remake>No</nyaa:remake>"
+        f"<description>{escape(description)}</description></item>")
+
+
+def _acg_item(show: int, episode: int):
+    i = item_id(show, episode)
+    t = title(show, episode)
+    description = "".join(
+        f"<p>{escape(t)} 简介第{line}行，字幕组招募翻译、校对、时轴。</p>" for line in range(8))
+    return (
+        f"<item><title>{escape(t)}</title>"
+        f"<description>{escape(description)}</description>"
+        f"<pubDate>{_date(episode)}</pubDate>"
+        f"<link>http://acg.rip/t/{i}</link><guid>http://acg.rip/t/{i}</guid>"
+        f'<enclosure url="http://acg.rip/t/{i}.torrent" type="application/x-bittorrent"/></item>')
+
+
+def _kisssub_item(show: int, episode: int):
+    i = item_id(show, episode)
+    h = info_hash(show, episode)
+    t = title(show, episode)
+    description = "".join(
+        f'<p><img src="http://img.example/{h}/{line}.jpg" alt="" /><br />'
+        f"<strong>{t}</strong> 第{line}段说明 &amp; 下载须知</p>" for line in range(12))
+    return (
+        f"<item><title><![CDATA[{t}]]></title>"
+        f"<link>http://www.kisssub.org/show-{h}.html</link>"
+        f"<description><![CDATA[{description}]]></description>"
+        f'<enclosure url="http://www.kisssub.org/down.php?hash={h}&amp;id={i}.torrent" length="1" type="application/x-bittorrent"></enclosure>'
+        f"<author><![CDATA[{_GROUPS[show % len(_GROUPS)]}]]></author>"
+        f'<guid isPermaLink="true">http://www.kisssub.org/show-{h}.html</guid>'
+        f"<category><![CDATA[动画]]></category><pubDate>{_date(episode)}</pubDate></item>")
+
+
+_ITEMS: Dict[str, Callable[[int, int], str]] = {
+    "nyaa.si": _nyaa_item,
+    "acg.rip": _acg_item,
+    "www.kisssub.org": _kisssub_item,
+}
+
+_HEADS = {
+    "nyaa.si": '<rss xmlns:atom="http://www.w3.org/2005/Atom" xmlns:nyaa="https://nyaa.si/xmlns/nyaa" version="2.0">'
+               "<channel><title>Nyaa - Torrent File RSS</title><description>RSS Feed</description><link>http://nyaa.si/</link>",
+    "acg.rip": '<rss version="2.0"><channel><title>ACG.RIP</title><description>ACG.RIP</description><link>http://acg.rip/</link><ttl>1800</ttl>',
+    "www.kisssub.org": '<rss version="2.0"><channel><title><![CDATA[爱恋动漫BT下载]]></title><link>http://www.kisssub.org</link>'
+                       "<description><![CDATA[爱恋动漫BT下载]]></description><language>zh-cn</language>",
+}
+
+
+def page(host: str, show: int, episodes: List[int]):
+    """
+    the feed of the episodes of a show, in the given order
+    """
+    return items_page(host, [(show, episode) for episode in episodes])
+
+
+def items_page(host: str, items: List[Tuple[int, int]]):
+    """
+    the feed of the (show, episode) items, in the given order
+    """
+    content = "".join(_ITEMS[host](show, episode) for show, episode in items)
+    return f'<?xml version="1.0" encoding="UTF-8"?>{_HEADS[host]}{content}</channel></rss>'.encode()
@@ -0,0 +1,64 @@
+"""
+write the fixed feed pages of benchmarks/corpus, named <hostname>--<label>.xml.
+
+the pages are generated by feeds.py, except acg.rip--recorded.xml which is a page recorded from acg.rip.
+the files are committed, only run it again when the corpus should change, the results of
+bench_parser.py are only comparable on the same corpus
+"""
+import re
+import shutil
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import feeds  # noqa: E402
+
+corpus_dir = Path(__file__).parent / "corpus"
+recorded = Path(__file__).parents[1] / "notebooks" / "test.xml"
+
+
+def _shows(host: str, count: int, per_show: int):
+    """
+    the items of several shows, like the page of a search or the front page
+    """
+    items = []
+    for index in range(count):
+        show, episode = divmod(index, per_show)
+        items.append((show, per_show - episode))
+    return feeds.items_page(host, items)
+
+
+def _heavy_attributes(content: bytes):
+    """
+    enclosures and links with many attributes, like the media rss extensions
+    """
+    def replace(match: re.Match):
+        url = match.group(1).decode()
+        attrs = " ".join(f'data-{i}="{i * 7919 % 1000}"' for i in range(12))
+        return (
+            f'<enclosure url="{url}" length="1288490188" type="application/x-bittorrent" {attrs}/>'
+            f'<media:content url="{url}" medium="document" fileSize="1288490188" type="application/x-bittorrent" {attrs}/>'
+            f'<atom:link href="{url}" rel="enclosure" type="application/x-bittorrent" {attrs}/>').encode()
+    content = re.sub(rb'<enclosure url="([^"]*)"[^>]*/>', replace, content)
+    return content.replace(
+        b'<rss version="2.0">',
+        b'<rss version="2.0" xmlns:media="http://search.yahoo.com/mrss/" xmlns:atom="http://www.w3.org/2005/Atom">')
+
+
+def main():
+    corpus_dir.mkdir(exist_ok=True)
+    pages = {
+        "nyaa.si--large.xml": _shows("nyaa.si", 75, 12),  # the size of a page of nyaa.si
+        "www.kisssub.org--cdata.xml": _shows("www.kisssub.org", 50, 12),
+        "acg.rip--enclosures.xml": _heavy_attributes(_shows("acg.rip", 50, 12)),
+    }
+    for name, content in pages.items():
+        (corpus_dir / name).write_bytes(content)
+    shutil.copyfile(recorded, corpus_dir / "acg.rip--recorded.xml")
+    for file in sorted(corpus_dir.glob("*.xml")):
+        print(f"{file.name} {file.stat().st_size} bytes")
+
+
+if __name__ == "__main__":
+    main()
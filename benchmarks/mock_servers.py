@@ -0,0 +1,201 @@
+"""
+local servers for the benchmarks.
+
+MockFeeds is used as the http proxy of trans-rss, so the feeds keep the hostnames of the builtin
+subscribe types. it serves the feeds of feeds.py and their torrent files.
+MockTransmission answers the rpc used by trans-rss.
+"""
+import base64
+import itertools
+import json
+import re
+import sys
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, str(Path(__file__).parents[1]))
+sys.path.insert(0, str(Path(__file__).parent))
+
+import feeds  # noqa: E402
+from trans_rss.common import bencode  # noqa: E402
+
+_SHOW = re.compile(r"show\D?(\d+)")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # the headers and the body are written separately, without it every response waits for the delayed ack
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status: int, body: bytes = b"", headers: dict = {}):
+        self.send_response(status)
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_json(self):
+        return json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+
+
+class MockFeeds:
+    """
+    every show has `episodes` episodes at first, and one more after each release.
+    the feeds are paged by `per_page` like nyaa.si, with ETag
+    """
+
+    def __init__(self, episodes: int = 12, per_page: int = 10) -> None:
+        self.episodes = episodes
+        self.per_page = per_page
+        self.released = 0
+        self.requests = Counter()
+        self.lock = threading.Lock()
+        mock = self
+
+        class Handler(_Handler):
+            def do_GET(self):
+                mock.handle(self)
+
+            def do_POST(self):
+                mock.control(self)
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def handle(self, handler: _Handler):
+        url = urlparse(handler.path)  # the absolute url, as a proxy
+        host = url.hostname or handler.headers.get("Host", "")
+        query = parse_qs(url.query)
+        if url.path.endswith(".torrent") or "id" in query:
+            with self.lock:
+                self.requests["torrent"] += 1
+            id = int(re.search(r"(\d+)\.torrent", handler.path).group(1))
+            handler.reply(200, feeds.torrent(id // 10000, id % 10000), {"Content-Type": "application/x-bittorrent"})
+            return
+        with self.lock:
+            self.requests["feed"] += 1
+        match = _SHOW.search(handler.path)
+        if host not in feeds.HOSTS or match is None:
+            handler.reply(404)
+            return
+        show = int(match.group(1))
+        # the paging of trans-rss appends page=, nyaa.si also has page=rss
+        pages = [int(p) for p in query.get("page", []) if p.isdigit()]
+        index = pages[-1] if pages else 1
+        count = self.episodes + self.released
+        etag = f'"{show}-{count}-{index}"'
+        if handler.headers.get("If-None-Match") == etag:
+            handler.reply(304, headers={"ETag": etag})
+            return
+        episodes = list(range(count, 0, -1))[(index - 1) * self.per_page:index * self.per_page]
+        handler.reply(200, feeds.page(host, show, episodes), {
+            "Content-Type": "application/xml; charset=utf-8", "ETag": etag})
+
+    def control(self, handler: _Handler):
+        """
+        POST /release publishes one more episode of every show, POST /stats returns and resets the counters
+        """
+        match urlparse(handler.path).path:
+            case "/release":
+                self.released += 1
+                handler.reply(200, b"{}")
+            case "/stats":
+                with self.lock:
+                    body = json.dumps(dict(self.requests)).encode()
+                    self.requests.clear()
+                handler.reply(200, body)
+            case _:
+                handler.reply(404)
+
+
+class MockTransmission:
+    def __init__(self) -> None:
+        self.torrents = {}
+        self.hashes = {}
+        self.ids = itertools.count(1)
+        self.requests = Counter()
+        self.lock = threading.Lock()
+        mock = self
+
+        class Handler(_Handler):
+            def do_POST(self):
+                mock.handle(self)
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def handle(self, handler: _Handler):
+        if urlparse(handler.path).path == "/stats":
+            handler.read_json()
+            with self.lock:
+                body = json.dumps(dict(self.requests)).encode()
+                self.requests.clear()
+            handler.reply(200, body)
+            return
+        body = handler.read_json()
+        if handler.headers.get("X-Transmission-Session-Id") != "benchmark":
+            handler.reply(409, headers={"X-Transmission-Session-Id": "benchmark"})
+            return
+        method = body["method"]
+        args = body.get("arguments", {})
+        with self.lock:
+            self.requests[method] += 1
+            result = self.call(method, args)
+        out = json.dumps({"result": "success", "arguments": result}).encode()
+        handler.reply(200, out, {"Content-Type": "application/json"})
+
+    def call(self, method: str, args: dict):
+        match method:
+            case "session-get":
+                return {"version": "4.0.0", "rpc-version": 17, "rpc-version-semver": "5.3.0"}
+            case "torrent-add":
+                if "metainfo" in args:
+                    h = bencode.info_hash(base64.b64decode(args["metainfo"]))
+                else:
+                    h = bencode.magnet_hash(args["filename"])
+                t = self.hashes.get(h)
+                if t is not None:
+                    return {"torrent-duplicate": {"id": t["id"], "name": t["name"], "hashString": h}}
+                id = next(self.ids)
+                t = self.torrents[id] = self.hashes[h] = {
+                    "id": id, "name": f"torrent {id}", "hashString": h,
+                    "torrentFile": f"/var/lib/transmission/torrents/{h}.torrent",
+                    "status": 4, "percentDone": 0.0, "downloadDir": args.get("download-dir")}
+                return {"torrent-added": {"id": id, "name": t["name"], "hashString": h}}
+            case "torrent-get":
+                ids = args.get("ids")
+                torrents = list(self.torrents.values())
+                if isinstance(ids, list):
+                    torrents = [t for t in torrents if t["id"] in ids or t["hashString"] in ids]
+                result = {"torrents": [{k: t[k] for k in args.get("fields", []) if k in t} for t in torrents]}
+                if ids == "recently-active":
+                    result["removed"] = []
+                return result
+            case _:
+                return {}
+
+
+def start(*servers):
+    for server in servers:
+        threading.Thread(target=server.server.serve_forever, daemon=True).start()
+
+
+if __name__ == "__main__":
+    feed_server, transmission = MockFeeds(), MockTransmission()
+    start(feed_server, transmission)
+    print(f"feeds (as http proxy): http://127.0.0.1:{feed_server.port}")
+    print(f"transmission: 127.0.0.1:{transmission.port}")
+    threading.Event().wait()
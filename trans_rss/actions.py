@@ -1,34 +1,25 @@
 import asyncio
-from functools import partial
-from multiprocessing.pool import AsyncResult, ThreadPool
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+import random
 import threading
 import time
-from typing import Callable, Generator, Iterable, List, Tuple
-from urllib.parse import urlparse
-from xml.dom.minidom import parseString, Element as XmlElement, Attr as XmlAttr, Document as XmlDocument
+from typing import Dict, Generator, Iterable, List, Set, Tuple, Union
+from urllib.parse import urldefrag, urlparse
 from pydantic import BaseModel
-import requests
+import transmission_rpc
 
 from trans_rss import subscribe_types
-from .sql import Subscribe, Connection
+from .sql import Subscribe, Connection, FeedCache, FeedItem, Schedule, SubscribeMark, normalize_url
 from .config import config
-from . import webhook_types
+from . import webhook_dispatcher, webhook_types
 from .logger import logger, update_logger
-from .common import executor, sub_status
+from .common import bencode, cache, cadence, executor, http_client, matcher, metrics, sub_status, trace
 from .common.toast_message import emit_message
 
 TAG = "Actions"
 
-
-def xml_get_text(node: XmlElement):
-    if node.nodeType == node.TEXT_NODE:
-        return node.data
-    ret = []
-    d: XmlElement
-    for d in node.childNodes:
-        if d.nodeType == d.TEXT_NODE:
-            ret.append(d.data)
-    return "".join(ret)
+CHUNK_SIZE = 64 * 1024
 
 
 class RSSParseResult(BaseModel):
@@ -38,103 +29,251 @@ class RSSParseResult(BaseModel):
     description: str
 
 
-def iter_rss(hostname: str, text: str):
-    sub_type = subscribe_types.get(hostname)
-    assert sub_type is not None, f"请先为网站{hostname}手动添加订阅模板"
-    doml: XmlDocument = parseString(text)
-    item: XmlElement
-    for item in doml.getElementsByTagName("item"):
-        title = sub_type.get_text(item, "title")
-        gui = sub_type.get_text(item, "gui")
-        torrent = sub_type.get_text(item, "torrent")
-        desc = sub_type.get_text(item, "description")
+def iter_rss(hostname: str, content: Union[str, bytes, Iterable[bytes]], encoding: Union[str, None] = None):
+    """
+    content can be the whole feed or the chunks of a streamed response,
+    encoding is the charset of the response, the xml declaration is used without it
+    """
+    extract = subscribe_types.get_extractor(hostname)
+    assert extract is not None, f"请先为网站{hostname}手动添加订阅模板"
+    for item in subscribe_types.iter_items(content, encoding=encoding):
+        texts = extract(item)
         yield RSSParseResult(
-            title=title,
-            gui=gui,
-            torrent=torrent,
-            description=desc)
+            title=texts["title"],
+            gui=texts["gui"],
+            torrent=texts["torrent"],
+            description=texts["description"])
+
+
+class _TimedChunks:
+    """
+    the chunks of a streamed response, counting their size and the time waiting for them
+    """
+
+    def __init__(self, chunks: Iterable[bytes]) -> None:
+        self._chunks = chunks
+        self.seconds = 0.
+        self.size = 0
+
+    def __iter__(self):
+        chunks = iter(self._chunks)
+        while True:
+            start = time.perf_counter()
+            chunk = next(chunks, None)
+            self.seconds += time.perf_counter() - start
+            if chunk is None:
+                return
+            self.size += len(chunk)
+            yield chunk
 
 
-def subscribe(sub: Subscribe):
-    page = 1
+def feed_pages(url: str, cache: Union[FeedCache, None] = None, page: int = 1) -> Generator[List[RSSParseResult], None, None]:
+    """
+    yield all items of the feed page by page, the next page is only requested
+    when the consumer asks for it.
+    if cache is given, the first page is requested conditionally with its validators,
+    and the validators of the new response are written back into it
+    """
     retry = 0
-    url = sub.url
-    r = urlparse(url)
-    if r.query:
+    url = urldefrag(url.strip()).url  # the fragment is never sent, the page would be appended to it
+    hostname = urlparse(url).hostname
+    if urlparse(url).query:
         url += "&page="
     else:
         url += "?page="
-    proxies = config.get_proxies()
-    include_words = set(sub.include_words.split())
-    exclude_words = set(sub.exclude_words.split())
     while True:
-        resp = requests.get(
-            f"{url}{page}", headers=config.get_headers(), proxies=proxies)
-        hostname = urlparse(sub.url).hostname
-        match resp.status_code:
-            case 500:  # page end
-                return
-            case 200:
-                retry = 0
-                cnt = 0
-                for result in iter_rss(hostname, resp.text):
-                    cnt += 1
-                    title = result.title
-                    update_logger.info(TAG, f"subscribe find-new {sub.name} {result.title} {result.gui} {result.torrent}")
-                    exclude = False
-                    for word in include_words:
-                        if word not in title:
-                            exclude = True
-                            update_logger.info(TAG, f"subscribe exclude {result.title} because without {word}")
-                            break
-                    if exclude:
-                        continue
-                    for word in exclude_words:
-                        if word in title:
-                            exclude = True
-                            update_logger.info(TAG, f"subscribe exclude {result.title} because with {word}")
-                            break
-                    if exclude:
-                        continue
-                    yield result
-                if not cnt:
+        headers = {}
+        if cache is not None and page == 1:
+            headers.update(cache.headers())
+        start = time.perf_counter()
+        with trace.span("fetch page", host=hostname, page=page), \
+                http_client.get(f"{url}{page}", headers=headers, stream=True) as resp:
+            waited = time.perf_counter() - start
+            trace.annotate(status=resp.status_code)
+            match resp.status_code:
+                case 304:  # not modified since the last update
+                    metrics.FETCH_SECONDS.observe(waited, host=hostname)
+                    update_logger.info(TAG, f"subscribe not-modified {url}{page}")
                     return
-                page += 1
-            case _:
-                retry += 1
-                if retry == 10:
+                case 500:  # page end
+                    metrics.FETCH_SECONDS.observe(waited, host=hostname)
                     return
+                case 200:
+                    if cache is not None and page == 1:
+                        cache.etag = resp.headers.get("ETag")
+                        cache.last_modified = resp.headers.get("Last-Modified")
+                    retry = 0
+                    chunks = _TimedChunks(resp.iter_content(CHUNK_SIZE))
+                    # requests guesses latin-1 for text/* without a charset, only a given one is used
+                    charset = resp.encoding if "charset" in resp.headers.get("Content-Type", "").lower() else None
+                    results = list(iter_rss(hostname, chunks, charset))
+                    # the parsing is interleaved with the download of the chunks
+                    waited += chunks.seconds
+                    metrics.FETCH_SECONDS.observe(waited, host=hostname)
+                    metrics.FETCH_BYTES.observe(chunks.size, host=hostname)
+                    parsed = time.perf_counter() - start - waited
+                    metrics.PARSE_SECONDS.observe(parsed, host=hostname)
+                    trace.annotate(
+                        items=len(results), bytes=chunks.size,
+                        network=f"{waited:.3f}s", parse=f"{parsed:.3f}s")
+                    if not results:
+                        return
+                    page += 1
+                case _:
+                    metrics.FETCH_SECONDS.observe(waited, host=hostname)
+                    retry += 1
+                    if retry == 10 or not config.auto_page:
+                        return
+                    continue
+        yield results
         if not config.auto_page:
             return
 
 
-def _broadcast(title: str, desc: str, link: str):
-    for webhook in config.webhooks:
-        if not webhook.enabled:
+def filter_items(sub: Subscribe, items: Iterable[RSSParseResult]):
+    match = matcher.get(
+        sub.include_words, sub.exclude_words, sub.word_regex, sub.word_normalize)
+    results: List[RSSParseResult] = []
+    for result in items:
+        reason = match.check(result.title)
+        if reason is not None:
+            update_logger.debug(TAG, f"subscribe exclude {sub.name} {result.title} because {reason}")
             continue
-        body = webhook_types.format(webhook.type, title, desc, link)
-        try:
-            resp = requests.post(
-                webhook.url, headers={'Content-Type': 'application/json'}, data=body)
-            if 200 <= resp.status_code <= 299:
-                logger.info(
-                    TAG, f"_broadcast success {webhook.type} {webhook.url} {resp.status_code}")
-            else:
-                logger.info(
-                    TAG, f"_broadcast failed {webhook.type} {webhook.url} {resp.status_code} {body}")
-        except Exception as e:
-            logger.exception(
-                TAG, f"_broadcast exception {webhook.type} {webhook.url} {body}")
-            emit_message(f"通知{webhook.url}失败，{str(e)}", 30, color="error")
+        update_logger.info(TAG, f"subscribe find-new {sub.name} {result.title} {result.gui} {result.torrent}")
+        results.append(result)
+    return results
+
+
+class SharedFeed:
+    """
+    the pages of one feed in an update, requested once and shared by the subscriptions of the feed.
+    url is requested as the first subscription gives it, key is the normalized url
+    """
+
+    def __init__(self, url: str, key: str, cache: FeedCache) -> None:
+        self.url = url
+        self.key = key
+        self.cache = cache
+        self._lock = threading.Lock()
+        self._pages: List[List[RSSParseResult]] = []
+        self._iter: Union[Generator[List[RSSParseResult], None, None], None] = None
+        self._done = False
+
+    def page(self, index: int) -> Union[List[RSSParseResult], None]:
+        """
+        all items of the page, None after the last page
+        """
+        with self._lock:
+            while len(self._pages) <= index and not self._done:
+                if self._iter is None:
+                    self._iter = feed_pages(self.url, self.cache, len(self._pages) + 1)
+                try:
+                    self._pages.append(next(self._iter))
+                except StopIteration:
+                    self._done = True
+                except Exception:
+                    self._iter = None  # the next caller requests the failed page again
+                    raise
+            if index < len(self._pages):
+                return self._pages[index]
+            return None
+
+    def pages(self):
+        index = 0
+        while (page := self.page(index)) is not None:
+            yield page
+            index += 1
+
+    def fetched(self):
+        """
+        the items of the requested pages, newest first
+        """
+        with self._lock:
+            return [item for page in self._pages for item in page]
+
+
+# the stored items of the feeds read by the web pages
+_feed_items: "cache.Cache[List[FeedItem]]" = cache.create("feed_items", 32, 600)
+# counted up when new items of a feed are committed, a read started before is not cached
+_feed_versions: Dict[str, int] = {}
+_feed_versions_lock = threading.Lock()
+
+
+def _items_committed(feed: str):
+    with _feed_versions_lock:
+        _feed_versions[feed] = _feed_versions.get(feed, 0) + 1
+        _feed_items.pop(feed)
+
+
+def _store_items(conn, feed: str, items: Iterable[RSSParseResult]):
+    """
+    the cached items of the feed are dropped once the items are committed, maybe after a batch
+    """
+    now = datetime.now()
+    conn.items_add(feed, (
+        FeedItem(feed=feed, first_seen=now, **item.dict()) for item in items), lambda: _items_committed(feed))
+
+
+def subscribe_stored(sub: Subscribe):
+    """
+    the items of the subscription from the item store filled by the updates.
+    the feed is requested when nothing of it is stored yet, and when no subscription polls it,
+    like a subscription not added yet, its stored items would be outdated then and it is not stored
+    """
+    feed = normalize_url(sub.url)
+    with Connection() as conn:
+        polled = feed in conn.subscribe_feeds()
+    if polled:
+        stored = _feed_items.get(feed)
+        if stored is None:
+            version = _feed_versions.get(feed)
+            with Connection() as conn:
+                stored = conn.items_get(feed)
+            with _feed_versions_lock:
+                if stored and _feed_versions.get(feed) == version:
+                    _feed_items.set(feed, stored)
+        if stored:
+            yield from filter_items(sub, (
+                RSSParseResult(title=item.title, gui=item.gui, torrent=item.torrent, description=item.description)
+                for item in stored))
+            return
+    fetched: List[RSSParseResult] = []
+    for page in feed_pages(sub.url):
+        fetched.extend(page)
+        yield from filter_items(sub, page)
+    if polled:
+        with Connection() as conn:  # all pages at once to keep the order
+            _store_items(conn, feed, fetched)
 
 
-def broadcast_test():
-    _broadcast("Trans-RSS测试", "测试webhook",
-               "https://github.com/liyihc/trans-rss")
+def _broadcast(title: str, desc: str, link: str):
+    webhook_dispatcher.enqueue(title, desc, link)
 
 
-def broadcast_update(name: str, title: str, torrent: str):
-    _broadcast(f"开始下载 {title}", f"订阅任务：{name}", torrent)
+def broadcast_test():
+    # sent at once to show the result
+    for webhook in config.webhooks:
+        if not webhook.enabled:
+            continue
+        body = webhook_types.format(
+            webhook.type, "Trans-RSS测试", "测试webhook", "https://github.com/liyihc/trans-rss")
+        success, msg = webhook_dispatcher.deliver(webhook.type, webhook.url, body)
+        if not success:
+            emit_message(f"通知{webhook.url}失败，{msg}", 30, color="error")
+
+
+def broadcast_updates(updates: List[Tuple[str, RSSParseResult]]):
+    """
+    one message for all downloads of an update
+    """
+    if not updates:
+        return
+    if len(updates) == 1:
+        name, item = updates[0]
+        _broadcast(f"开始下载 {item.title}", f"订阅任务：{name}", item.torrent)
+        return
+    lines = [f"{name}：{item.title}" for name, item in updates]
+    _broadcast(f"开始下载 {len(updates)} 个剧集", "\n".join(lines), updates[-1][1].torrent)
 
 
 def broadcast_error(name: str, link: str):
@@ -148,145 +287,543 @@ def broadcast_recovery():
 lock = threading.Lock()
 
 
-def _update_one(sub: Subscribe):
-    with lock, Connection() as conn, ThreadPool() as pool:
+def _fetch_one(sub: Subscribe, feed: SharedFeed):
+    """
+    return the new items of the subscription in the feed, newest first,
+    together with the high-water mark to save once they are downloaded
+    """
+    with Connection() as conn:
         update_logger.info(TAG, f"update name: {sub.name} url: {sub.url}")
 
         emit_message(f"正在查找 {sub.name}")
 
+        old_mark = conn.subscribe_mark_get(sub.name)
+        mark = old_mark
+        sub_status.status_check(sub.name)
         first = True
         l: List[RSSParseResult] = []
-        for item in subscribe(sub):
-            if first:
-                sub_status.status_update(sub.name, item.title, item.gui, item.torrent)
-                first = False
-            if conn.download_exist(item.torrent):
+        for page in feed.pages():
+            with trace.span("dedup", items=len(page)):
+                # only measured here, the pages viewed on the web are filtered too
+                seen = len(page)
+                start = time.perf_counter()
+                page = filter_items(sub, page)
+                metrics.FILTER_SECONDS.observe(time.perf_counter() - start, subscription=sub.name)
+                metrics.ITEMS.inc(seen, subscription=sub.name, kind="seen")
+                metrics.ITEMS.inc(seen - len(page), subscription=sub.name, kind="excluded")
+                exists = conn.download_exist_many(item.torrent for item in page)
+            known = None
+            if old_mark is not None:
+                exists.add(old_mark.torrent)
+            for item in page:
+                if first:
+                    sub_status.status_update(sub.name, item.title, item.gui, item.torrent)
+                    mark = SubscribeMark(name=sub.name, gui=item.gui, torrent=item.torrent)
+                    first = False
+                if item.torrent in exists:
+                    known = item
+                    break
+                l.append(item)
+            if known is not None:
                 update_logger.info(TAG,
-                                   f"update stop because exist name: {sub.name} title: {item.title} link: {item.gui} torrent: {item.torrent}")
-                emit_message(f"订阅 {sub.name} 存在 {item.title}")
-                break
-            l.append(item)
-
-        trans_client = None if config.without_transmission else config.transmission.client()
-        results: List[AsyncResult] = []
-        for item in reversed(l):
+                                   f"update stop because exist name: {sub.name} title: {known.title} link: {known.gui} torrent: {known.torrent}")
+                emit_message(f"订阅 {sub.name} 存在 {known.title}")
+                break  # the next page is never requested
+        metrics.ITEMS.inc(len(l), subscription=sub.name, kind="new")
+        return l, mark
+
+
+def _save_mark(mark: Union[SubscribeMark, None]):
+    if mark is not None:
+        with Connection() as conn:
+            conn.subscribe_mark_set(mark)
+
+
+def _load_feeds(subs: List[Subscribe]) -> Dict[str, SharedFeed]:
+    """
+    one shared feed for each normalized url, with the validators of the last update,
+    the url is requested as the first subscription gives it, some feeds do not accept it normalized
+    """
+    feeds: Dict[str, SharedFeed] = {}
+    with Connection() as conn:
+        for sub in subs:
+            key = normalize_url(sub.url)
+            if key not in feeds:
+                feeds[key] = SharedFeed(sub.url, key, conn.feed_cache_get(key))
+    return feeds
+
+
+def _save_feeds(feeds: Iterable[SharedFeed], failed: Set[str]):
+    """
+    store the polled items of the feeds, and the validators of the feeds not in failed
+    """
+    with Connection() as conn, conn.batch():
+        for feed in feeds:
+            _store_items(conn, feed.key, feed.fetched())
+            if feed.key not in failed:
+                conn.feed_cache_set(feed.cache)
+
+
+def _fetch_torrent(url: str) -> Tuple[Union[bytes, str], Union[str, None]]:
+    """
+    the torrent to add to transmission, the content of the .torrent file or the magnet link,
+    with its info hash if it can be computed
+    """
+    if url.startswith("magnet:"):
+        return url, bencode.magnet_hash(url)
+    hostname = urlparse(url).hostname or ""
+    with trace.span("fetch torrent", host=hostname), metrics.TORRENT_FETCH_SECONDS.time(host=hostname):
+        resp = http_client.get(url, timeout=10)
+        content = resp.content
+    resp.raise_for_status()
+    try:
+        info_hash = bencode.info_hash(content)
+    except (ValueError, IndexError):
+        logger.warn(TAG, f"not a torrent file {url}")
+        info_hash = None
+    return content, info_hash
+
+
+def _transmission_client():
+    with trace.span("transmission connect"), metrics.TRANSMISSION_SECONDS.time(method="session-get"):
+        return config.transmission.client()
+
+
+def _add_torrent(trans_client: transmission_rpc.Client, content: Union[bytes, str], sub: Subscribe):
+    try:
+        with trace.span("transmission add"), metrics.TRANSMISSION_SECONDS.time(method="torrent-add"):
+            return trans_client.add_torrent(
+                content, download_dir=config.join(sub.name), paused=config.transmission.pause_after_add)
+    except transmission_rpc.TransmissionError as e:
+        # older transmission reports a torrent added before as an error
+        resp = e.response or {}
+        if resp.get("result") != "duplicate torrent":
+            raise
+        return transmission_rpc.Torrent(fields=resp["arguments"]["torrent-duplicate"])
+
+
+def _record_downloads(name: str, downloads: List[Tuple[str, Union[str, None]]]):
+    # one transaction for the whole subscription
+    with Connection() as conn, conn.batch():
+        for url, info_hash in downloads:
+            conn.download_add(url, None, name, info_hash)
+
+
+def _not_downloaded(conn, sub: Subscribe, items: Iterable[RSSParseResult]):
+    new_items: List[RSSParseResult] = []
+    for item in items:
+        if conn.download_exist(item.torrent):
             update_logger.info(
-                TAG, f"update download name: {sub.name} title: {item.title} link: {item.gui} torrent: {item.gui}")
+                TAG, f"update skip because exist name: {sub.name} title: {item.title} torrent: {item.torrent}")
+        else:
+            new_items.append(item)
+    return new_items
 
-            if config.without_transmission:
-                conn.download_add(item.torrent)
-            else:
-                resp = requests.get(
-                    item.torrent, timeout=10, headers=config.get_headers(),
-                    proxies=config.get_proxies())
-                t = trans_client.add_torrent(
-                    resp.content, download_dir=config.join(sub.name), paused=config.transmission.pause_after_add)
-
-                time.sleep(2)
-                t = trans_client.get_torrent(t.id)
-                try:
-                    torrent_file = t.torrent_file
-                except:
-                    torrent_file = None
-                conn.download_add(item.torrent, torrent_file)
-            results.append(
-                pool.apply_async(
-                    broadcast_update, (sub.name, item.title, item.torrent)))
 
-            emit_message(f"订阅 {sub.name} 下载 {item.title}")
-            yield sub.name, item
-        pool.close()
-        pool.join()
+async def _download_one(sub: Subscribe, items: List[RSSParseResult]):
+    with Connection() as conn:
+        # another subscription of this update may have downloaded it after the fetch
+        new_items = _not_downloaded(conn, sub, reversed(items))
+    if not new_items:
+        return
+
+    with trace.span("wait lock"):
+        await executor.acquire(lock)
+    # items are recorded only after transmission accepted them, with their info hashes
+    downloaded: List[Tuple[str, Union[str, None]]] = []
+    contents: List[asyncio.Future] = []
+    try:
+        # another update may have downloaded them while this one waited for the lock
+        with Connection() as conn:
+            new_items = _not_downloaded(conn, sub, new_items)
+        if not new_items:
+            return
+        if not config.without_transmission:
+            trans_client = await executor.run_in_io(_transmission_client)
+            # the torrent files are downloaded concurrently, and added to transmission in order
+            fetching = asyncio.Semaphore(max(config.torrent_fetch_concurrency, 1))
+
+            async def fetch(url: str):
+                async with fetching:
+                    return await executor.run_in_io(_fetch_torrent, url)
+            contents = [asyncio.ensure_future(fetch(item.torrent)) for item in new_items]
+
+        hashes = set()
+        urls = set()
+        for index, item in enumerate(new_items):
+            info_hash = bencode.magnet_hash(item.torrent)
+            if not config.without_transmission:
+                content, info_hash = await contents[index]
+                with Connection() as conn:
+                    duplicated = conn.download_hash_exist(info_hash) or info_hash in hashes
+                    known = conn.download_exist(item.torrent) or item.torrent in urls
+                if duplicated:  # the same torrent from another url, like a mirror site
+                    update_logger.info(
+                        TAG, f"update skip because same torrent name: {sub.name} title: {item.title} torrent: {item.torrent} hash: {info_hash}")
+                    if not known:
+                        urls.add(item.torrent)
+                        downloaded.append((item.torrent, info_hash))
+                    continue
 
+            update_logger.info(
+                TAG, f"update download name: {sub.name} title: {item.title} link: {item.gui} torrent: {item.gui}")
+            if not config.without_transmission:
+                t = await executor.run_in_io(_add_torrent, trans_client, content, sub)
+                info_hash = info_hash or t.fields.get("hashString")
+            if info_hash:
+                hashes.add(info_hash)
+            urls.add(item.torrent)
+            downloaded.append((item.torrent, info_hash))
 
-async def update():
+            emit_message(f"订阅 {sub.name} 下载 {item.title}")
+            yield sub.name, item
+    finally:
+        for content in contents:
+            if not content.cancel() and not content.cancelled():
+                content.exception()  # retrieved, failures after the failed one are not reported
+        try:
+            if downloaded:
+                await executor.run_in_db(_record_downloads, sub.name, downloaded)
+        finally:
+            lock.release()
+
+
+class _Limiter:
+    """
+    bound the number of subscriptions fetched at the same time, globally and per hostname
+    """
+
+    def __init__(self, total: int, per_host: int) -> None:
+        self._total = asyncio.Semaphore(max(total, 1))
+        self._per_host = max(per_host, 1)
+        self._hosts: Dict[str, asyncio.Semaphore] = {}
+
+    @asynccontextmanager
+    async def acquire(self, url: str):
+        hostname = urlparse(url).hostname or ""
+        host = self._hosts.get(hostname)
+        if host is None:
+            host = self._hosts[hostname] = asyncio.Semaphore(self._per_host)
+        with trace.span("wait", host=hostname):
+            await host.acquire()
+            try:
+                await self._total.acquire()
+            except BaseException:
+                host.release()
+                raise
+        try:
+            yield
+        finally:
+            self._total.release()
+            host.release()
+
+
+async def _update_sub(
+        sub: Subscribe, feed: SharedFeed, limiter: _Limiter, download_lock: asyncio.Lock,
+        queue: "asyncio.Queue[Tuple[Subscribe, Union[RSSParseResult, None]]]",
+        cycle: Union[trace.Span, None] = None):
+    start = time.perf_counter()
+    try:
+        with trace.span("subscription", cycle, subscription=sub.name):
+            for retry in reversed(range(3)):
+                try:
+                    async with limiter.acquire(sub.url):
+                        items, mark = await executor.run_in_io(_fetch_one, sub, feed)
+                    if items:
+                        # database writes and transmission adds stay serialized
+                        with trace.span("wait download"):
+                            await download_lock.acquire()
+                        try:
+                            async for _, item in _download_one(sub, items):
+                                await queue.put((sub, item))
+                        finally:
+                            download_lock.release()
+                    # only remember the mark after every new item is handled
+                    await executor.run_in_db(_save_mark, mark)
+                    return bool(items)
+                except Exception as e:
+                    logger.exception(
+                        TAG, f"{sub.name} tried {3-retry} times, {retry} times left")
+                    if not retry:
+                        raise
+    finally:
+        metrics.SUBSCRIPTION_SECONDS.observe(time.perf_counter() - start, subscription=sub.name)
+        await queue.put((sub, None))
+
+
+def _next_schedule(
+        sub: Subscribe, old: Union[Schedule, None], changed: Union[bool, None],
+        release: Union[cadence.Cadence, None] = None):
+    """
+    changed is None when the update failed, the interval is kept then.
+    with a known release cadence, poll at the base interval around the release and rarely otherwise,
+    a release missing after its window is polled like the feeds without a cadence until it comes
+    """
+    idle = old.idle if old else 0
+    if changed:
+        idle = 0
+    elif changed is not None:
+        idle += 1
+    now = datetime.now()
+    base = sub.minutes or config.subscribe_minutes
+    limit = None
+    if release is None or release.late(now):
+        # back off the feeds without anything new for a while
+        minutes = min(
+            base * 2 ** max(idle - config.schedule_idle_polls, 0),
+            max(config.schedule_max_minutes, base))
+    else:
+        idle = 0  # the backoff of a late release starts from the base interval
+        start = release.next_release(now) - release.window()
+        if start <= now:
+            minutes = base
+        else:
+            minutes = max(config.schedule_max_minutes, base)
+            limit = start
+    # spread the subscriptions added together
+    minutes *= random.uniform(1 - config.schedule_jitter, 1 + config.schedule_jitter)
+    next_run = now + timedelta(minutes=minutes)
+    if limit is not None:
+        next_run = min(next_run, limit)
+    return Schedule(name=sub.name, next_run=next_run, idle=idle)
+
+
+def _reschedule(subs: List[Subscribe], results: List[Union[bool, None]]):
+    with Connection() as conn:
+        schedules = {schedule.name: schedule for schedule in conn.schedule_list()}
+        times = conn.download_times_all()
+        releases = {sub.name: cadence.estimate(times.get(sub.name, [])) for sub in subs}
+        with conn.batch():
+            for sub, changed in zip(subs, results):
+                conn.schedule_set(_next_schedule(
+                    sub, schedules.get(sub.name), changed, releases[sub.name]))
+
+
+def _due_subscribes() -> Tuple[List[str], Union[datetime, None]]:
+    """
+    the subscriptions to update, the most overdue first, and when the next one is due.
+    the other subscriptions of a due feed are updated together, since the feed validators are shared
+    """
     with Connection() as conn:
+        schedules = {schedule.name: schedule for schedule in conn.schedule_list()}
         subs = list(conn.subscribe_list())
-        updated = set()
-        error_sub: Subscribe = None
-        error_msg: str = None
-        names = {sub.name for sub in subs}
+    now = datetime.now()
+    due: List[Tuple[datetime, str]] = []
+    next_run = None
+    for sub in subs:
+        schedule = schedules.get(sub.name)
+        if schedule is None or schedule.next_run <= now:  # new subscriptions are due at once
+            due.append((schedule.next_run if schedule else datetime.min, sub.name))
+    names = [name for _, name in sorted(due)]
+    due_names = set(names)
+    due_feeds = {normalize_url(sub.url) for sub in subs if sub.name in due_names}
+    for sub in subs:
+        schedule = schedules.get(sub.name)
+        if schedule is None or schedule.next_run <= now:
+            continue
+        if normalize_url(sub.url) in due_feeds:
+            names.append(sub.name)
+        elif next_run is None or schedule.next_run < next_run:
+            next_run = schedule.next_run
+    return names, next_run
+
+
+async def update(names: Union[Iterable[str], None] = None):
+    """
+    update the subscriptions of names in order, or all subscriptions
+    """
+    start = time.perf_counter()
+    with Connection() as conn:
+        all_subs = list(conn.subscribe_list())
+    all_names = {sub.name for sub in all_subs}
+    if names is None:
+        subs = all_subs
+    else:
+        order = {name: index for index, name in enumerate(names)}
+        subs = sorted((sub for sub in all_subs if sub.name in order), key=lambda sub: order[sub.name])
+    limiter = _Limiter(config.update_concurrency,
+                       config.update_host_concurrency)
+    download_lock = asyncio.Lock()
+    queue: "asyncio.Queue[Tuple[Subscribe, Union[RSSParseResult, None]]]" = asyncio.Queue()
+    # not the current span, the context of a generator is the consumer's across the yields
+    cycle = trace.begin("update", subscriptions=len(subs))
+    tasks = []
+    try:
+        with trace.span("load", cycle):
+            feeds = await executor.run_in_db(_load_feeds, subs)
+        tasks = [
+            asyncio.create_task(_update_sub(
+                sub, feeds[normalize_url(sub.url)], limiter, download_lock, queue, cycle))
+            for sub in subs]
+        updates: List[Tuple[str, RSSParseResult]] = []
+        running = len(tasks)
+        while running:
+            sub, item = await queue.get()
+            if item is None:
+                running -= 1
+                continue
+            yield sub.name, item
+            updates.append((sub.name, item))
+        cnt = len(updates)
+        cycle.attrs["downloads"] = cnt
         try:
-            cnt = 0
-            for sub in subs:
-                for retry in reversed(range(3)):
-                    try:
-                        async for name, item in executor.iter_in_thread(partial(_update_one, sub)):
-                            yield name, item
-                            cnt += 1
-                        updated.add(sub.name)
-                        break
-                    except Exception as e:
-                        logger.exception(
-                            TAG, f"tried {3-retry} times, {retry} times left")
-                        if not retry:
-                            error_sub = sub
-                            raise
-            if cnt:
-                emit_message(f"共添加{cnt}个新下载项", color="success")
-            else:
-                emit_message(f"未找到有更新的订阅", color="success")
+            with trace.span("notify", cycle):
+                await executor.run_in_db(broadcast_updates, updates)
+        except Exception:
+            logger.exception(TAG, "update failed to queue the notifications")
+
+        error_subs: List[Subscribe] = []
+        error: Exception = None
+        results: List[Union[bool, None]] = []
+        for sub, result in zip(subs, await asyncio.gather(*tasks, return_exceptions=True)):
+            if isinstance(result, Exception):
+                error_subs.append(sub)
+                error = result
+                result = None
+            results.append(result)
+        try:
+            # the validators are only kept when every subscription of the feed handled its new items
+            with trace.span("save", cycle):
+                await executor.run_in_db(
+                    _save_feeds, feeds.values(), {normalize_url(sub.url) for sub in error_subs})
+                await executor.run_in_db(_reschedule, subs, results)
+        except Exception:
+            logger.exception(TAG, "update failed to save the feeds and schedules")
+
+        if cnt:
+            emit_message(f"共添加{cnt}个新下载项", color="success")
+        elif not error_subs:
+            emit_message(f"未找到有更新的订阅", color="success")
+
+        if not error_subs:
             if sub_status.get_status_error_msg():
                 try:
-                    await executor.run_in_thread(broadcast_recovery)
+                    await executor.run_in_db(broadcast_recovery)
                 except:
                     pass
             sub_status.set_status_error_msg("")
-        except Exception as e:
-            errors = names.difference(updated)
-            for name in errors:
-                sub_status.status_error(name)
+        else:
+            for sub in error_subs:
+                sub_status.status_error(sub.name)
             if not sub_status.get_status_error_msg() and config.notify_failed_update:  # skip if notified
                 try:
-                    await executor.run_in_thread(broadcast_error, error_sub.name, error_sub.url)
+                    await executor.run_in_db(broadcast_error, error_subs[0].name, error_subs[0].url)
                 except:
                     pass
+            error_msg = f"订阅 {'、'.join(sub.name for sub in error_subs)} 更新失败"
             sub_status.set_status_error_msg(error_msg)
-            logger.exception(TAG, str(e))
-            emit_message(f"订阅中出现错误 {e}", duration=30, color="error")
-        finally:
-            status = sub_status._status
-            for k in list(status.keys()):
-                if k not in names:
-                    status.pop(k)
-
+            logger.error(TAG, f"{error_msg} {error}")
+            emit_message(f"订阅中出现错误 {error}", duration=30, color="error")
+    finally:
+        for task in tasks:
+            task.cancel()
+        status = sub_status._status
+        for k in list(status.keys()):
+            if k not in all_names:
+                status.pop(k)
+        metrics.UPDATE_SECONDS.observe(time.perf_counter() - start)
+        trace.end(cycle)
+
+
+class _Scheduler:
+    """
+    update the due subscriptions on one event loop kept in a daemon thread.
+    update(repeat=True) starts the routine, update() updates all subscriptions once
+    """
 
-class _UpdateTimer:
     def __init__(self) -> None:
-        self._update_timer: threading.Timer = None
+        self._lock = threading.Lock()
+        self._loop: Union[asyncio.AbstractEventLoop, None] = None
+        self._wake: asyncio.Event = None
         self._running = False
+        self._check_at: Union[float, None] = None  # monotonic time to look for due subscriptions
+        self._full_at: Union[float, None] = None  # monotonic time to update all subscriptions
+
+    def _start_loop(self):
+        with self._lock:
+            if self._loop is not None:
+                return
+            loop = asyncio.new_event_loop()
+            started = threading.Event()
+
+            def run():
+                asyncio.set_event_loop(loop)
+                self._wake = asyncio.Event()
+                loop.create_task(self._main())
+                started.set()
+                loop.run_forever()
+            threading.Thread(target=run, name="scheduler", daemon=True).start()
+            started.wait()
+            self._loop = loop
 
     def update(self, timeout_second: int = 0, repeat=False):
-        if self._update_timer is not None:
-            self._update_timer.cancel()
-        if repeat and not self._running:
+        self._start_loop()
+        if repeat:
             self._running = True
-        self._update_timer = threading.Timer(timeout_second, self._timeout)
-        self._update_timer.daemon = True
-        self._update_timer.start()
 
-    def _timeout(self):
-        async def async_func():
+        def request():
+            at = time.monotonic() + timeout_second
+            if repeat:
+                self._check_at = at
+            else:
+                self._full_at = at
+            self._wake.set()
+        self._loop.call_soon_threadsafe(request)
+
+    async def _run(self, names: Union[List[str], None]):
+        try:
+            update_logger.info(
+                TAG, f"routine task start {'all' if names is None else names}")
+            async for _ in update(names):
+                pass
+        except:
+            logger.exception(TAG, "routine task failed")
+
+    async def _main(self):
+        while True:
+            now = time.monotonic()
+            waits: List[float] = []
+            if self._full_at is not None:
+                if self._full_at <= now:
+                    self._full_at = None
+                    await self._run(None)
+                    continue
+                waits.append(self._full_at - now)
+            if self._running:
+                if self._check_at is None or self._check_at <= now:
+                    try:
+                        names, next_run = await executor.run_in_db(_due_subscribes)
+                    except Exception:
+                        logger.exception(TAG, "scheduler failed to load the schedules")
+                        names, next_run = [], None
+                    if names:
+                        await self._run(names)
+                    if next_run is None:
+                        seconds = config.get_seconds()
+                    else:
+                        seconds = (next_run - datetime.now()).total_seconds()
+                    # at least a few seconds, in case the schedules were not saved
+                    self._check_at = time.monotonic() + min(max(seconds, 5), config.get_seconds())
+                    continue
+                waits.append(self._check_at - now)
+            self._wake.clear()
             try:
-                update_logger.info(TAG, "routine task start")
-                async for _ in update():
-                    pass
-            except:
+                await asyncio.wait_for(self._wake.wait(), min(waits) if waits else None)
+            except asyncio.TimeoutError:
                 pass
-        asyncio.run(async_func())
-        if self._running:
-            self._update_timer = None
-            self.update(config.subscribe_minutes*60, repeat=True)
 
     def cancel(self):
-        if self._update_timer is not None:
-            self._update_timer.cancel()
-            self._update_timer = None
         self._running = False
+        if self._loop is not None:
+            def request():
+                self._full_at = None
+                self._check_at = None
+                self._wake.set()
+            self._loop.call_soon_threadsafe(request)
 
     @property
     def is_running(self):
         return self._running
 
 
-update_timer = _UpdateTimer()
+update_timer = _Scheduler()
@@ -5,11 +5,12 @@ from typing import List
 import pywebio
 from fastapi import FastAPI, Request, Response, responses, staticfiles
 
-from trans_rss.common import executor, sub_status, toast_message
+from trans_rss.common import cache, executor, http_client, metrics, sub_status, toast_message
 
-from . import actions
+from . import actions, torrent_index, webhook_dispatcher
 from .config import config, version
 from .logger import logger
+from . import sql
 from .sql import Connection, Subscribe
 from .web import routes as web_routes
 
@@ -50,19 +51,25 @@ async def test_transmission():
     toast_message.start_emit()
     with Connection() as conn:
         pass  # test db
+    webhook_dispatcher.start()
     if not config.without_transmission:
         try:  # test transmission
-            client = config.transmission.client()
-            client.get_torrents(timeout=2)
+            torrent_index.refresh(full=True)
         except Exception as e:
             logger.exception(TAG, str(e))
             config.without_transmission = True
             actions.update_timer.cancel()
             sub_status.set_status_error_msg("连接不上Transmission，停止")
+    torrent_index.start()
     if config.auto_start:
         actions.update_timer.update(5, True)
 
 
+@app.on_event("shutdown")
+async def close_sql():
+    sql.close()
+
+
 @app.get("/api/test-sql")
 async def test_sql(sql_statement: str):
     with Connection() as conn:
@@ -75,7 +82,7 @@ async def post_subscribe(name: str, url: str):
     with Connection() as conn:
         conn.subscribe(Subscribe(name=name, url=url))
         sub = Subscribe(name=name, url=url)
-        return [item async for item in executor.iter_in_thread(actions.subscribe, sub)]
+        return [item async for item in executor.iter_in_thread(actions.subscribe_stored, sub)]
 
 
 @app.delete("/api/subscribe")
@@ -98,11 +105,8 @@ async def mark_download(torrent: str):
 
 @app.post("/api/start")
 async def start():
+    # the routine updates the due subscriptions at once, /api/manual_update waits for an update
     actions.update_timer.update(repeat=True)
-    ret = []
-    async for item in actions.update():
-        ret.append(item)
-    return ret
 
 
 @app.post("/api/stop")
@@ -121,3 +125,18 @@ async def update():
 @app.post("/api/test_webhooks")
 async def test_webhooks():
     await executor.run_in_thread(actions.broadcast_test)
+
+
+@app.get("/api/http-stats")
+async def http_stats():
+    return http_client.stats()
+
+
+@app.get("/api/cache-stats")
+async def cache_stats():
+    return cache.stats()
+
+
+@app.get("/metrics")
+async def get_metrics():
+    return responses.PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
@@ -1,3 +1,11 @@
+from . import bencode
+from . import cache
+from . import cadence
+from . import cassette
 from . import executor
+from . import http_client
+from . import matcher
+from . import metrics
 from . import sub_status
-from . import toast_message
\ No newline at end of file
+from . import toast_message
+from . import trace
\ No newline at end of file
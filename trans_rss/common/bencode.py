@@ -0,0 +1,59 @@
+import base64
+import hashlib
+from typing import Union
+from urllib.parse import parse_qs, urlparse
+
+
+def _end(data: bytes, i: int) -> int:
+    """
+    the index after the bencoded value starting at i, the value is not decoded
+    """
+    c = data[i:i + 1]
+    if c == b"i":
+        return data.index(b"e", i) + 1
+    if c in (b"l", b"d"):
+        i += 1
+        while data[i:i + 1] != b"e":
+            i = _end(data, i)
+        return i + 1
+    if c.isdigit():
+        colon = data.index(b":", i)
+        end = colon + 1 + int(data[i:colon])
+        if end > len(data):
+            raise ValueError("truncated bencode")
+        return end
+    raise ValueError(f"invalid bencode at {i}")
+
+
+def info_hash(torrent: bytes) -> str:
+    """
+    the sha1 of the info dict of a .torrent file, in lower-case hex as transmission shows it
+    """
+    if torrent[:1] != b"d":
+        raise ValueError("not a torrent")
+    i = 1
+    while torrent[i:i + 1] != b"e":
+        key_end = _end(torrent, i)
+        value_end = _end(torrent, key_end)
+        if torrent[torrent.index(b":", i) + 1:key_end] == b"info":
+            return hashlib.sha1(torrent[key_end:value_end]).hexdigest()
+        i = value_end
+    raise ValueError("no info in the torrent")
+
+
+def magnet_hash(url: str) -> Union[str, None]:
+    """
+    the btih of a magnet link in lower-case hex, or None
+    """
+    r = urlparse(url)
+    if r.scheme != "magnet":
+        return None
+    for xt in parse_qs(r.query).get("xt", []):
+        if not xt.lower().startswith("urn:btih:"):
+            continue
+        value = xt[9:]
+        if len(value) == 40:
+            return value.lower()
+        if len(value) == 32:
+            return base64.b32decode(value.upper()).hex()
+    return None
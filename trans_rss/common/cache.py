@@ -0,0 +1,97 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Generic, Hashable, Tuple, TypeVar, Union
+
+T = TypeVar("T")
+
+_MISSING = object()
+
+
+class Cache(Generic[T]):
+    """
+    a least-recently-used cache bounded by size, the items also expire after ttl seconds if given.
+    the operations hold a lock and never wait for anything else,
+    so it is safe to use from the threads and from the event loop
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: Union[float, None] = None) -> None:
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[Hashable, Tuple[float, T]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable, default=None) -> Union[T, None]:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            expire, value = entry
+            if expire < time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: T):
+        expire = time.monotonic() + self.ttl if self.ttl is not None else float("inf")
+        with self._lock:
+            self._data[key] = (expire, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(False)
+                self.evictions += 1
+
+    def get_or_set(self, key: Hashable, factory: Callable[[], T]) -> T:
+        """
+        factory is called without the lock, two callers may both call it for a missing key
+        """
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = factory()
+            self.set(key, value)
+        return value
+
+    def pop(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+_caches: Dict[str, Cache] = {}
+
+
+def create(name: str, maxsize: int, ttl: Union[float, None] = None) -> Cache:
+    """
+    a new cache, listed in stats() by name
+    """
+    cache = _caches[name] = Cache(name, maxsize, ttl)
+    return cache
+
+
+def stats():
+    return {name: cache.stats() for name, cache in _caches.items()}
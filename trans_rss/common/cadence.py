@@ -0,0 +1,71 @@
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Iterable, Union
+
+from pydantic import BaseModel
+
+from trans_rss.config import config
+
+WEEKDAYS = "一二三四五六日"
+
+
+class Cadence(BaseModel):
+    """
+    a weekly release, at the minute of the day on the weekday
+    """
+    weekday: int
+    minute: int
+    last: datetime  # the latest release seen
+
+    def window(self):
+        return timedelta(minutes=config.cadence_window_minutes)
+
+    def _release_before(self, now: datetime):
+        """
+        the release time of this week, or of the last week if it is later than now
+        """
+        day = now - timedelta(days=(now.weekday() - self.weekday) % 7)
+        release = day.replace(
+            hour=self.minute // 60, minute=self.minute % 60, second=0, microsecond=0)
+        if release > now:
+            release -= timedelta(days=7)
+        return release
+
+    def late(self, now: datetime):
+        """
+        the last release time has passed without a download around it, the episode may come late
+        """
+        release = self._release_before(now)
+        return release + self.window() < now and self.last < release - self.window()
+
+    def next_release(self, now: datetime):
+        """
+        the next release not seen yet, it may be a little earlier than now while inside the window
+        """
+        release = self._release_before(now)
+        window = self.window()
+        while release + window < now or self.last >= release - window:
+            release += timedelta(days=7)
+        return release
+
+    def describe(self, now: datetime):
+        release = self.next_release(now)
+        return f"周{WEEKDAYS[release.weekday()]} {release.strftime('%m-%d %H:%M')}"
+
+
+def estimate(times: Iterable[datetime]) -> Union[Cadence, None]:
+    """
+    estimate the weekly release from the download times of a subscription.
+    the downloads of one day count once, so a backfill is only one release
+    """
+    days = {}
+    for dt in sorted(times):
+        days.setdefault(dt.date(), dt)
+    hits = list(days.values())
+    if len(hits) < config.cadence_min_hits:
+        return None
+    weekday, count = Counter(hit.weekday() for hit in hits).most_common(1)[0]
+    if count < config.cadence_min_hits or count * 2 < len(hits):  # not weekly
+        return None
+    minutes = sorted(hit.hour * 60 + hit.minute for hit in hits if hit.weekday() == weekday)
+    return Cadence(weekday=weekday, minute=minutes[len(minutes) // 2], last=hits[-1])
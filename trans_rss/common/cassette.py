@@ -0,0 +1,130 @@
+import base64
+import hashlib
+import io
+import json
+import threading
+import time
+from typing import Dict, List, Tuple
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from trans_rss.config import cassette_dir, config
+from trans_rss.logger import logger
+
+TAG = "Cassette"
+
+# the body is stored decoded
+_DROP_HEADERS = {"content-encoding", "content-length", "transfer-encoding"}
+
+_lock = threading.Lock()
+# the loaded cassettes and the index of the next response to replay of each
+_replay: Dict[str, Tuple[List[dict], int]] = {}
+
+
+def _path(request: requests.PreparedRequest):
+    """
+    one file for each method, url and body, the responses of the same request are kept in order
+    """
+    body = request.body or b""
+    if isinstance(body, str):
+        body = body.encode()
+    key = hashlib.sha1(f"{request.method} {request.url}\n".encode() + body).hexdigest()
+    return cassette_dir / (urlparse(request.url).hostname or "_") / f"{key}.json"
+
+
+def _load(path):
+    if path.exists():
+        return json.loads(path.read_text(encoding="utf-8"))
+    return None
+
+
+def record(request: requests.PreparedRequest, response: requests.Response, elapsed: float):
+    path = _path(request)
+    entry = {
+        "status": response.status_code,
+        "reason": response.reason,
+        "headers": {k: v for k, v in response.headers.items() if k.lower() not in _DROP_HEADERS},
+        "body": base64.b64encode(response.content).decode(),
+        "elapsed": elapsed,
+    }
+    with _lock:
+        cassette = _load(path) or {"method": request.method, "url": request.url, "responses": []}
+        cassette["responses"].append(entry)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(cassette, ensure_ascii=False, indent=4), encoding="utf-8")
+    logger.debug(TAG, f"record {request.method} {request.url} {response.status_code}")
+
+
+def replay(request: requests.PreparedRequest):
+    """
+    the recorded responses of the request in order, the last one is repeated when they are used up.
+    None if the request was never recorded
+    """
+    path = _path(request)
+    key = str(path)
+    with _lock:
+        if key not in _replay:
+            cassette = _load(path)
+            if cassette is None:
+                return None
+            _replay[key] = (cassette["responses"], 0)
+        responses, index = _replay[key]
+        _replay[key] = (responses, index + 1)
+    return responses[min(index, len(responses) - 1)]
+
+
+def reset():
+    """
+    replay from the first recorded responses again
+    """
+    with _lock:
+        _replay.clear()
+
+
+class RecordAdapter(HTTPAdapter):
+    """
+    send the requests as usual, and save every response into the cassettes.
+    the body is read at once, streamed responses are not streamed while recording
+    """
+
+    def send(self, request: requests.PreparedRequest, *args, **kwds) -> requests.Response:
+        start = time.perf_counter()
+        response = super().send(request, *args, **kwds)
+        response.content  # read the whole body, iter_content reuses it
+        record(request, response, time.perf_counter() - start)
+        return response
+
+
+class ReplayAdapter(BaseAdapter):
+    """
+    answer the requests from the cassettes without the network, after the configured latency
+    """
+
+    def send(self, request: requests.PreparedRequest, stream=False, timeout=None, verify=True, cert=None, proxies=None) -> requests.Response:
+        entry = replay(request)
+        if entry is None:
+            logger.warn(TAG, f"replay missing {request.method} {request.url}")
+            raise requests.ConnectionError(f"no cassette for {request.method} {request.url}", request=request)
+        latency = config.http_cassette_latency
+        if config.http_cassette_recorded_latency:
+            latency += entry["elapsed"]
+        if latency > 0:
+            time.sleep(latency)
+
+        response = requests.Response()
+        response.status_code = entry["status"]
+        response.reason = entry["reason"]
+        response.headers = CaseInsensitiveDict(entry["headers"])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.raw = io.BytesIO(base64.b64decode(entry["body"]))
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+    def close(self):
+        pass
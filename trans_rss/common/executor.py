@@ -1,13 +1,18 @@
 import asyncio
+import contextvars
+import threading
 from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from queue import Queue
+from functools import partial
 from traceback import format_exc
 from types import NoneType
 from typing import Any, AsyncGenerator, Callable, Generator, Iterable, TypeVar
 
+from trans_rss.config import config
 from trans_rss.logger import logger
 
+from . import metrics, trace
+
 TAG = "Executor"
 
 T = TypeVar("T")
@@ -19,30 +24,72 @@ class _ThreadFuncError:
     format_exc: str
 
 
+io_pool = ThreadPoolExecutor(config.io_threads, thread_name_prefix="io")
+# the only thread that writes the database for the update
+db_pool = ThreadPoolExecutor(1, thread_name_prefix="db")
+
+
+async def _run_in(pool: ThreadPoolExecutor, func: Callable[..., T], *args, **kwds) -> T:
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(pool, partial(ctx.run, func, *args, **kwds))
+
+
+async def run_in_io(func: Callable[..., T], *args, **kwds) -> T:
+    """
+    run blocking IO (http, transmission) in the shared pool, exceptions are kept as is
+    """
+    return await _run_in(io_pool, func, *args, **kwds)
+
+
+async def acquire(lock: threading.Lock, interval: float = 0.05):
+    """
+    acquire the lock shared by the event loops without blocking the loop or a pool thread,
+    the caller releases it. nothing is left holding it if the waiting task is cancelled
+    """
+    while not lock.acquire(blocking=False):
+        await asyncio.sleep(interval)
+
+
+async def run_in_db(func: Callable[..., T], *args, **kwds) -> T:
+    def timed():
+        # only the time running in the pool, not waiting for it
+        name = getattr(func, "__name__", "")
+        with trace.span("db", task=name), metrics.DB_SECONDS.time(task=name):
+            return func(*args, **kwds)
+    return await _run_in(db_pool, timed)
+
+
 async def iter_in_thread(func: Callable[..., Generator[T, Any, Any]], *args, **kwds) -> AsyncGenerator[T, Any]:
-    def new_func(q: Queue):
+    loop = asyncio.get_running_loop()
+    q: "asyncio.Queue[Any]" = asyncio.Queue()
+
+    def put(item):
+        try:
+            loop.call_soon_threadsafe(q.put_nowait, item)
+        except RuntimeError:  # the loop is closed, nobody is waiting
+            pass
+
+    def new_func():
         try:
             for item in func(*args, **kwds):
-                q.put(item)
-            q.put(None)
+                put(item)
+            put(None)
         except Exception as e:
             logger.exception(TAG, f"exception in iter_in_thread\n{e}")
-            q.put(_ThreadFuncError(e.args, format_exc()))
+            put(_ThreadFuncError(e.args, format_exc()))
 
-    q = Queue()
     # create_task will start the thread
-    task = asyncio.create_task(asyncio.to_thread(new_func, q))
-    loop = asyncio.get_running_loop()
-    with ThreadPoolExecutor(1) as pool:
-        while True:
-            result = await loop.run_in_executor(pool, q.get)
-            if isinstance(result, (_ThreadFuncError, NoneType)):
-                await task  # wait until the task finish
-                if result is None:
-                    return
-                raise Exception(*result.args)
-            else:
-                yield result
+    task = asyncio.create_task(asyncio.to_thread(new_func))
+    while True:
+        result = await q.get()
+        if isinstance(result, (_ThreadFuncError, NoneType)):
+            await task  # wait until the task finish
+            if result is None:
+                return
+            raise Exception(*result.args)
+        else:
+            yield result
 
 
 async def run_in_thread(func: Callable[..., T], *args, **kwds) -> T:
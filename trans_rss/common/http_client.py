@@ -0,0 +1,126 @@
+import threading
+from collections import Counter
+from typing import Dict, Tuple, Union
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from trans_rss.config import config
+from trans_rss.logger import logger
+
+from . import cassette
+
+TAG = "Http"
+
+_lock = threading.Lock()
+_session: Union[requests.Session, None] = None
+_session_key: Tuple = ()
+
+_requests: Counter = Counter()
+_errors: Counter = Counter()
+
+
+def _settings():
+    return (config.http_pool_hosts, config.http_pool_size, config.http_retries, config.http_backoff, config.http_cassette)
+
+
+def _build_session():
+    session = requests.Session()
+    if config.http_cassette == "replay":
+        adapter = cassette.ReplayAdapter()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+    retry = Retry(
+        total=config.http_retries,
+        backoff_factor=config.http_backoff,
+        status_forcelist=(429, 502, 503, 504),  # 500 means page end for some sites
+        allowed_methods=frozenset({"GET", "HEAD"}),
+        respect_retry_after_header=True,
+        raise_on_status=False)
+    adapter_type = cassette.RecordAdapter if config.http_cassette == "record" else HTTPAdapter
+    adapter = adapter_type(
+        pool_connections=config.http_pool_hosts,
+        pool_maxsize=config.http_pool_size,
+        max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def session():
+    """
+    the shared session, rebuilt when the related configs are changed
+    """
+    global _session, _session_key
+    with _lock:
+        key = _settings()
+        if _session is None or key != _session_key:
+            if _session is not None:
+                _session.close()
+            logger.debug(TAG, f"session build {key}")
+            _session = _build_session()
+            _session_key = key
+        return _session
+
+
+def request(method: str, url: str, *, headers: Union[Dict[str, str], None] = None, **kwds):
+    """
+    send a request with the configured user agent, proxies and timeout
+    """
+    all_headers = config.get_headers()
+    if headers:
+        all_headers.update(headers)
+    kwds.setdefault("proxies", config.get_proxies())
+    kwds.setdefault("timeout", config.http_timeout)
+    hostname = urlparse(url).hostname or ""
+    _requests[hostname] += 1
+    try:
+        return session().request(method, url, headers=all_headers, **kwds)
+    except Exception:
+        _errors[hostname] += 1
+        raise
+
+
+def get(url: str, **kwds):
+    return request("GET", url, **kwds)
+
+
+def post(url: str, **kwds):
+    return request("POST", url, **kwds)
+
+
+def stats():
+    pools = []
+    with _lock:
+        s = _session
+    if s is not None:
+        adapters = {id(adapter): adapter for adapter in s.adapters.values()}
+        for adapter in adapters.values():
+            if not isinstance(adapter, HTTPAdapter):
+                continue
+            managers = [adapter.poolmanager, *adapter.proxy_manager.values()]
+            for manager in managers:
+                for key in list(manager.pools.keys()):
+                    pool = manager.pools.get(key)
+                    if pool is None:
+                        continue
+                    queue = pool.pool
+                    pools.append({
+                        "scheme": pool.scheme,
+                        "host": pool.host,
+                        "port": pool.port,
+                        "connections": pool.num_connections,
+                        "requests": pool.num_requests,
+                        # the queue is pre-filled with None placeholders
+                        "idle": sum(conn is not None for conn in list(queue.queue)) if queue is not None else 0,
+                        "maxsize": queue.maxsize if queue is not None else 0
+                    })
+    return {
+        "hosts": {
+            host: {"requests": count, "errors": _errors[host]}
+            for host, count in _requests.items()},
+        "pools": pools
+    }
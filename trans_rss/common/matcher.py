@@ -0,0 +1,102 @@
+import re
+import unicodedata
+from functools import partial
+from typing import Iterable, Union
+
+from . import cache
+
+
+def normalize(text: str):
+    """
+    full-width to half-width and case-insensitive
+    """
+    return unicodedata.normalize("NFKC", text).casefold()
+
+
+class Matcher:
+    """
+    classify titles by the include and exclude words of a subscription.
+
+    the words are compiled into one regular expression, so a title is scanned once by the
+    C regex engine instead of once for every word. for the plain words, a lookahead at every
+    position finds the longest word starting there, the words inside a found word are found too.
+    a pure-python Aho-Corasick automaton would walk the title character by character
+    in the interpreter, which is slower than this for the few words of a subscription
+    """
+
+    def __init__(self, include_words: Iterable[str], exclude_words: Iterable[str], regex=False, normalized=False) -> None:
+        self.normalized = normalized
+        self.regex = regex
+        if not normalized:
+            prepare = str
+        elif regex:  # casefold would change escapes like \S, the case is ignored by the flag
+            prepare = partial(unicodedata.normalize, "NFKC")
+        else:
+            prepare = normalize
+        self.include = list(dict.fromkeys(prepare(word) for word in include_words))
+        self.exclude = list(dict.fromkeys(prepare(word) for word in exclude_words))
+        flags = re.IGNORECASE if normalized and regex else 0
+        self._exclude = None
+        if self.exclude:
+            self._exclude = re.compile(
+                "|".join(f"(?:{word})" if regex else re.escape(word) for word in self.exclude), flags)
+        if regex:
+            self._includes = [re.compile(word, flags) for word in self.include]
+            return
+        self._include = None
+        if self.include:
+            # the longer words first, so the longest word starting at each position is taken
+            words = sorted(self.include, key=len, reverse=True)
+            self._include = re.compile(
+                "(?=(" + "|".join(re.escape(word) for word in words) + "))")
+        # the include words inside each include word
+        self._implied = {
+            word: [other for other in self.include if other in word]
+            for word in self.include}
+
+    def _missing(self, title: str) -> Union[str, None]:
+        if self.regex:
+            for pattern, word in zip(self._includes, self.include):
+                if not pattern.search(title):
+                    return word
+            return None
+        if self._include is None:
+            return None
+        found = set()
+        for match in self._include.finditer(title):
+            word = match.group(1)
+            if word not in found:
+                found.update(self._implied[word])
+                if len(found) == len(self.include):
+                    return None
+        for word in self.include:
+            if word not in found:
+                return word
+        return None
+
+    def check(self, title: str) -> Union[str, None]:
+        """
+        None if the title is accepted, or the reason why it is excluded
+        """
+        if self.normalized:
+            title = normalize(title)
+        missing = self._missing(title)
+        if missing is not None:
+            return f"without {missing}"
+        if self._exclude is not None:
+            match = self._exclude.search(title)
+            if match:
+                return f"with {match.group(0)}"
+        return None
+
+
+_matchers: "cache.Cache[Matcher]" = cache.create("matchers", 256)
+
+
+def get(include_words: str, exclude_words: str, regex=False, normalized=False) -> Matcher:
+    """
+    the matcher of the space separated words, compiled once
+    """
+    return _matchers.get_or_set(
+        (include_words, exclude_words, regex, normalized),
+        lambda: Matcher(include_words.split(), exclude_words.split(), regex, normalized))
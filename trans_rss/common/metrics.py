@@ -0,0 +1,133 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+_DEFAULT_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60)
+_BYTES_BUCKETS = (1 << 10, 4 << 10, 16 << 10, 64 << 10, 256 << 10, 1 << 20, 4 << 20, 16 << 20)
+
+
+def _escape(value: str):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def _key(self, labels: Dict[str, str]):
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+
+    def _format_labels(self, key: Tuple[str, ...], extra: str = ""):
+        pairs = [f'{label}="{_escape(value)}"' for label, value in zip(self.labels, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}", *self._samples()]
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()) -> None:
+        super().__init__(name, help, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            return [f"{self.name}{self._format_labels(key)} {value}" for key, value in self._values.items()]
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets=_DEFAULT_BUCKETS) -> None:
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        # the counts of each bucket, not cumulative, the last one for +Inf, the sum and the count
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[index] += 1
+            total[0] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self):
+        lines = []
+        with self._lock:
+            for key, (counts, total) in self._values.items():
+                cumulative = 0
+                for bound, count in zip((*self.buckets, "+Inf"), counts):
+                    cumulative += count
+                    le = f'le="{bound}"'
+                    lines.append(f"{self.name}_bucket{self._format_labels(key, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{self._format_labels(key)} {total[0]}")
+                lines.append(f"{self.name}_count{self._format_labels(key)} {cumulative}")
+        return lines
+
+
+_metrics: List[_Metric] = []
+
+
+def render():
+    """
+    all metrics in the prometheus text format
+    """
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+UPDATE_SECONDS = Histogram(
+    "trans_rss_update_seconds", "duration of an update of the subscriptions")
+SUBSCRIPTION_SECONDS = Histogram(
+    "trans_rss_subscription_seconds", "duration of the update of a subscription", ("subscription", ))
+FETCH_SECONDS = Histogram(
+    "trans_rss_fetch_seconds", "time waiting for the network while requesting a feed page", ("host", ))
+FETCH_BYTES = Histogram(
+    "trans_rss_fetch_bytes", "size of a feed page", ("host", ), _BYTES_BUCKETS)
+PARSE_SECONDS = Histogram(
+    "trans_rss_parse_seconds", "time parsing a feed page", ("host", ))
+FILTER_SECONDS = Histogram(
+    "trans_rss_filter_seconds", "time filtering a page for a subscription", ("subscription", ))
+DB_SECONDS = Histogram(
+    "trans_rss_db_seconds", "time of a database task of the update", ("task", ))
+TORRENT_FETCH_SECONDS = Histogram(
+    "trans_rss_torrent_fetch_seconds", "time downloading a torrent file", ("host", ))
+TRANSMISSION_SECONDS = Histogram(
+    "trans_rss_transmission_seconds", "time of a transmission rpc", ("method", ))
+WEBHOOK_SECONDS = Histogram(
+    "trans_rss_webhook_seconds", "time delivering a webhook message", ("type", ))
+WEBHOOK_DELIVERIES = Counter(
+    "trans_rss_webhook_deliveries_total", "webhook deliveries by result", ("type", "result"))
+ITEMS = Counter(
+    "trans_rss_items_total", "feed items of the subscriptions, by seen, new and excluded", ("subscription", "kind"))
@@ -23,6 +23,12 @@ def status_update(name: str, title: str, link: str, torrent: str):
         query_time=datetime.now().replace(microsecond=0))
 
 
+def status_check(name: str):
+    if name in _status:
+        _status[name].query_time = datetime.now().replace(microsecond=0)
+        _status[name].last_error = False
+
+
 def status_error(name: str):
     if name in _status:
         _status[name].query_time = datetime.now().replace(microsecond=0)
@@ -0,0 +1,124 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Union
+
+from trans_rss.config import config
+
+
+class Span:
+    def __init__(self, name: str, attrs: Dict[str, Any]) -> None:
+        self.name = name
+        self.attrs = attrs
+        self.start_time = datetime.now()
+        self.start = time.perf_counter()
+        self.end: Union[float, None] = None
+        self.error: Union[str, None] = None
+        self.children: List["Span"] = []
+
+    @property
+    def seconds(self):
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def finish(self):
+        if self.end is None:
+            self.end = time.perf_counter()
+
+    def walk(self, depth: int = 0):
+        """
+        the spans of the tree depth-first with their depth, children in the order they started
+        """
+        yield depth, self
+        for child in sorted(list(self.children), key=lambda span: span.start):
+            yield from child.walk(depth + 1)
+
+
+_current: ContextVar[Union[Span, None]] = ContextVar("trace_span", default=None)
+_lock = threading.Lock()
+# the kept traces of each name, so the frequent webhook rounds do not push out the updates
+_traces: Dict[str, Deque[Span]] = {}
+
+
+def begin(name: str, **attrs) -> Span:
+    """
+    start a trace, its spans are given as parent explicitly.
+    for a trace crossing a yield, where the current span of the context can not be kept
+    """
+    return Span(name, attrs)
+
+
+def end(root: Span):
+    """
+    finish the trace and keep it, only the last config.trace_keep traces of each name are kept
+    """
+    root.finish()
+    with _lock:
+        kept = _traces.setdefault(root.name, deque())
+        kept.append(root)
+        while len(kept) > max(config.trace_keep, 0):
+            kept.popleft()
+
+
+@contextmanager
+def trace(name: str, **attrs):
+    """
+    a trace with itself as the current span
+    """
+    root = begin(name, **attrs)
+    token = _current.set(root)
+    try:
+        yield root
+    except Exception as e:
+        root.error = repr(e)
+        raise
+    finally:
+        _current.reset(token)
+        end(root)
+
+
+@contextmanager
+def span(name: str, parent: Union[Span, None] = None, **attrs):
+    """
+    a child of parent or of the current span, nothing is recorded outside of a trace.
+    the current span is passed to the threads by executor and to the tasks by asyncio
+    """
+    parent = parent or _current.get()
+    if parent is None:
+        yield None
+        return
+    s = Span(name, attrs)
+    parent.children.append(s)
+    token = _current.set(s)
+    try:
+        yield s
+    except Exception as e:
+        s.error = repr(e)
+        raise
+    finally:
+        _current.reset(token)
+        s.finish()
+
+
+def current():
+    return _current.get()
+
+
+def annotate(**attrs):
+    """
+    add the attributes to the current span if any
+    """
+    s = _current.get()
+    if s is not None:
+        s.attrs.update(attrs)
+
+
+def traces():
+    """
+    the kept traces of all names, the newest first
+    """
+    with _lock:
+        roots = [root for kept in _traces.values() for root in kept]
+    return sorted(roots, key=lambda root: root.start, reverse=True)
@@ -29,6 +29,8 @@ class Transmission(BaseModel):
     username: Optional[str] = None
     password: Optional[str] = None
     pause_after_add = False
+    index_seconds: float = 30  # refresh the torrent index with the recently active torrents
+    index_full_seconds: float = 600  # reload the whole torrent index
 
     def client(self, timeout=30):
         return transmission_rpc.Client(
@@ -55,9 +57,35 @@ class Config(BaseModel):
     base_folder: str = "/downloads/complete"
     http_header_agent: str = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)'
     http_proxy: str = ""
+    http_timeout: float = 30
+    http_retries: int = 3
+    http_backoff: float = 1
+    http_pool_hosts: int = 10
+    http_pool_size: int = 10
+    # record the responses into the cassettes, or replay them without the network
+    http_cassette: Literal["off", "record", "replay"] = "off"
+    http_cassette_latency: float = 0  # seconds added to each replayed response
+    http_cassette_recorded_latency: bool = False  # also wait as long as the recorded response took
     notify_failed_update: bool = True
     without_transmission: bool = True
     auto_page: bool = False
+    update_concurrency: int = 8
+    update_host_concurrency: int = 2
+    torrent_fetch_concurrency: int = 4
+    io_threads: int = 8
+    sql_readers: int = 4
+    sql_busy_timeout: float = 30
+    webhook_interval: float = 1
+    webhook_retries: int = 5
+    webhook_retry_seconds: float = 30
+    webhook_poll_seconds: float = 60
+    schedule_idle_polls: int = 3
+    schedule_max_minutes: int = 1440
+    schedule_jitter: float = 0.1
+    cadence_window_minutes: int = 180
+    cadence_min_hits: int = 3
+    trace_keep: int = 10
+    feed_items_keep: int = 500  # the stored items of each feed, the oldest are dropped
     update_logger_level: LOG_LEVEL = "INFO"
     logger_level: LOG_LEVEL = "INFO"
     config_version: str = "0.2.1"
@@ -94,14 +122,16 @@ class Config(BaseModel):
 
 
 app_dir = Path(__file__).parents[1]
-config_dir: Path = app_dir / "configs"
-log_dir = app_dir / "logs"
+# the folders can be moved by the environment, like for the benchmarks
+config_dir: Path = Path(os.environ.get("TRANS_RSS_CONFIG", app_dir / "configs"))
+log_dir = Path(os.environ.get("TRANS_RSS_LOGS", app_dir / "logs"))
 config_path = config_dir / "config.json"
 sql_path = config_dir / "data.sqlite3"
 webhook_dir = config_dir / "webhooks"
 webhook_builtin_dir = Path(__file__).parent / "builtin_webhooks"
 subscribe_dir = config_dir / "subscribes"
 subscribe_builtin_dir = Path(__file__).parent / "builtin_subscribes"
+cassette_dir = config_dir / "cassettes"
 
 config_dir.mkdir(parents=True, exist_ok=True)
 webhook_dir.mkdir(parents=True, exist_ok=True)
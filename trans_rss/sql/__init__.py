@@ -1 +1 @@
-from .sql import Subscribe, Connection
\ No newline at end of file
+from .sql import Subscribe, Connection, FeedCache, FeedItem, SubscribeMark, Schedule, WebhookMessage, close, normalize_url
@@ -3,11 +3,16 @@ from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
 import sqlite3
-from typing import Union
+import threading
+from typing import Callable, Dict, Iterable, List, Set, Tuple, Union
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 from pydantic import BaseModel
 
 from ..config import sql_path, config
-from .updates import update
+from ..logger import logger
+from .updates import update, version
+
+TAG = "Sql"
 
 
 class Subscribe(BaseModel):
@@ -15,52 +20,333 @@ class Subscribe(BaseModel):
     url: str
     include_words: str = ""
     exclude_words: str = ""
+    minutes: int = 0  # 0 for config.subscribe_minutes
+    word_regex: bool = False  # the words are regular expressions
+    word_normalize: bool = False  # ignore the case and full-width / half-width
 
 
 class DownloadTorrent(BaseModel):
     url: str
     dt: datetime
     local_torrent: Union[str, None]
+    info_hash: Union[str, None] = None
 
 
-class _Sql:
-    def __init__(self, conn: sqlite3.Connection, exist: bool) -> None:
-        conn.row_factory = sqlite3.Row
-        self.conn = conn
-        if not exist:
-            self.build()
-        update(conn)
+def normalize_url(url: str):
+    """
+    the key of a feed, the same for the urls only different in the case of the host,
+    the order of the query or the fragment
+    """
+    r = urlsplit(url.strip())
+    query = urlencode(sorted(parse_qsl(r.query, keep_blank_values=True)))
+    return urlunsplit((r.scheme.lower(), r.netloc.lower(), r.path or "/", query, ""))
+
+
+class FeedCache(BaseModel):
+    url: str
+    etag: Union[str, None] = None
+    last_modified: Union[str, None] = None
+
+    def headers(self):
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class SubscribeMark(BaseModel):
+    """
+    the newest item of a subscription seen by the last successful update
+    """
+    name: str
+    gui: str
+    torrent: str
+
+
+class FeedItem(BaseModel):
+    """
+    an item seen in a feed, feed is the normalized url
+    """
+    feed: str
+    gui: str
+    title: str
+    torrent: str
+    description: str = ""
+    first_seen: datetime
+
+
+class Schedule(BaseModel):
+    """
+    when a subscription should be updated next, and how many updates found nothing new
+    """
+    name: str
+    next_run: datetime
+    idle: int = 0
+
+
+class WebhookMessage(BaseModel):
+    """
+    a rendered webhook body waiting to be delivered
+    """
+    id: Union[int, None] = None
+    type: str
+    url: str
+    body: str
+    tries: int = 0
+    next_try: datetime
 
-    def build(self):
-        with self.conn as conn:
-            conn.execute("""
+
+# the parameters of one query are limited by SQLITE_MAX_VARIABLE_NUMBER
+_BATCH = 500
+
+# every url and info hash of the downloaded table, loaded once and kept in sync by download_add after each commit
+_known_urls: Set[str] = set()
+_known_hashes: Set[str] = set()
+
+_PRAGMAS = [
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -8000",  # KiB
+    "PRAGMA mmap_size = 67108864",
+    "PRAGMA temp_store = MEMORY",
+]
+
+
+def _build(conn: sqlite3.Connection):
+    with conn:
+        conn.execute("""
 CREATE TABLE infos(
     key VARCHAR(20) PRIMARY KEY,
     value TEXT) """)
-            conn.execute("""
+        conn.execute("""
 CREATE TABLE subscribe(
     name VARCHAR(20) PRIMARY KEY,
     url TEXT,
     include_words TEXT,
-    exclude_words TEXT) """)
-            conn.execute("""
+    exclude_words TEXT,
+    minutes INTEGER DEFAULT 0,
+    word_regex INTEGER DEFAULT 0,
+    word_normalize INTEGER DEFAULT 0) """)
+        conn.execute("""
+CREATE TABLE items(
+    feed TEXT,
+    gui TEXT,
+    title TEXT,
+    torrent TEXT,
+    description TEXT,
+    first_seen datetime,
+    PRIMARY KEY(feed, torrent)) """)
+
+        conn.execute("""
 CREATE TABLE downloaded(
     url VARCHAR(256) PRIMARY KEY,
     dt datetime,
-    local_torrent VARCHAR(256)) """)
+    local_torrent VARCHAR(256),
+    subscribe VARCHAR(20),
+    info_hash VARCHAR(40)) """)
+        conn.execute("CREATE INDEX downloaded_subscribe ON downloaded(subscribe, dt)")
+        conn.execute("CREATE INDEX downloaded_info_hash ON downloaded(info_hash)")
+        conn.execute("""
+CREATE TABLE feed_cache(
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT) """)
+        conn.execute("""
+CREATE TABLE subscribe_mark(
+    name VARCHAR(20) PRIMARY KEY,
+    gui TEXT,
+    torrent TEXT) """)
+        conn.execute("""
+CREATE TABLE webhook_queue(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    type TEXT,
+    url TEXT,
+    body TEXT,
+    tries INTEGER,
+    next_try datetime) """)
+        conn.execute("""
+CREATE TABLE schedule(
+    name VARCHAR(20) PRIMARY KEY,
+    next_run datetime,
+    idle INTEGER) """)
+
+        conn.execute('INSERT INTO infos VALUES("version", ?)', (version, ))
 
-            conn.execute('INSERT INTO infos VALUES("version", "0.5.11")')
+
+class _Pool:
+    """
+    one writer connection shared by all threads behind a lock, and a few reader connections.
+    the database is built and updated once, by the first user
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._writer: Union[sqlite3.Connection, None] = None
+        self._readers: List[sqlite3.Connection] = []
+        self.write_lock = threading.RLock()
+
+    def _connect(self):
+        conn = sqlite3.Connection(
+            sql_path, check_same_thread=False, timeout=config.sql_busy_timeout)
+        conn.row_factory = sqlite3.Row
+        for pragma in _PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def writer(self):
+        if self._writer is None:
+            with self._lock:
+                if self._writer is None:
+                    exist = sql_path.exists()
+                    writer = self._connect()
+                    if not exist:
+                        _build(writer)
+                    update(writer)
+                    cursor = writer.execute("SELECT url, info_hash FROM downloaded")
+                    for url, info_hash in cursor:
+                        _known_urls.add(url)
+                        if info_hash:
+                            _known_hashes.add(info_hash)
+                    self._writer = writer
+        return self._writer
+
+    def acquire(self):
+        self.writer()
+        with self._lock:
+            if self._readers:
+                return self._readers.pop()
+        return self._connect()
+
+    def release(self, conn: sqlite3.Connection):
+        if conn.in_transaction:  # statements sent through _Sql.conn directly
             conn.commit()
+        with self._lock:
+            if len(self._readers) < config.sql_readers:
+                self._readers.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        with self._lock, self.write_lock:
+            for conn in self._readers:
+                conn.close()
+            self._readers.clear()
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+
+_pool = _Pool()
+
+
+class _Sql:
+    def __init__(self, conn: sqlite3.Connection) -> None:
+        self.conn = conn
+        # the statements of the batch, each with what to do once it is committed
+        self._pending: Union[List[Tuple[str, tuple, Union[Callable[[], None], None]]], None] = None
+
+    @contextmanager
+    def _write(self):
+        with _pool.write_lock:
+            with _pool.writer() as conn:  # commit, or rollback on exception
+                yield conn
+
+    def _execute(self, statement: str, parameters: tuple, committed: Union[Callable[[], None], None] = None):
+        """
+        committed is called after the statement is committed, never if it fails
+        """
+        if self._pending is not None:
+            self._pending.append((statement, parameters, committed))
+        else:
+            with self._write() as conn:
+                conn.execute(statement, parameters)
+            if committed is not None:
+                committed()
+
+    @contextmanager
+    def batch(self):
+        """
+        queue the writes and commit them in one transaction when leaving.
+        the queued writes are also committed when leaving with an exception,
+        so the work finished before the exception is kept
+        """
+        if self._pending is not None:  # already in a batch
+            yield
+            return
+        self._pending = []
+        try:
+            yield
+        finally:
+            pending, self._pending = self._pending, None
+            self._flush(pending)
+
+    def _flush(self, pending: List[Tuple[str, tuple, Union[Callable[[], None], None]]]):
+        if not pending:
+            return
+        try:
+            with self._write() as conn:
+                for statement, parameters, _ in pending:
+                    conn.execute(statement, parameters)
+        except sqlite3.Error as e:
+            logger.exception(TAG, f"batch failed, write one by one {e}")
+        else:
+            for _, _, committed in pending:
+                if committed is not None:
+                    committed()
+            return
+        for statement, parameters, committed in pending:  # do not lose the others for one failure
+            try:
+                with self._write() as conn:
+                    conn.execute(statement, parameters)
+            except sqlite3.Error:
+                logger.exception(TAG, f"batch write failed {statement} {parameters}")
+                continue
+            if committed is not None:
+                committed()
 
     def subscribe(self, sub: Subscribe):
-        self.conn.execute(
-            "REPLACE INTO subscribe VALUES(?,?,?,?)",
-            (sub.name, sub.url, sub.include_words, sub.exclude_words))
-        self.conn.commit()
+        old = self.conn.execute("SELECT url FROM subscribe WHERE name = ?", (sub.name, )).fetchone()
+        with self.batch():
+            self._execute(
+                "REPLACE INTO subscribe(name, url, include_words, exclude_words, minutes, word_regex, word_normalize) "
+                "VALUES(?,?,?,?,?,?,?)",
+                (sub.name, sub.url, sub.include_words, sub.exclude_words, sub.minutes,
+                 sub.word_regex, sub.word_normalize))
+            # the validators only tell what the subscriptions polled before have seen,
+            # the new or changed one reads the whole feed at the next update
+            self._execute("DELETE FROM feed_cache WHERE url = ?", (normalize_url(sub.url), ))
+            if old is not None and normalize_url(old["url"]) != normalize_url(sub.url):
+                self._items_prune(sub.name, sub.url)
 
     def subscribe_del(self, name: str):
-        self.conn.execute("DELETE FROM subscribe WHERE name = ?", (name, ))
-        self.conn.commit()
+        with self.batch():
+            self._execute("DELETE FROM subscribe WHERE name = ?", (name, ))
+            self._execute("DELETE FROM subscribe_mark WHERE name = ?", (name, ))
+            self._execute("DELETE FROM schedule WHERE name = ?", (name, ))
+            self._items_prune(name)
+
+    def subscribe_feeds(self) -> Set[str]:
+        """
+        the normalized urls of the feeds polled by the subscriptions
+        """
+        cursor = self.conn.execute("SELECT url FROM subscribe")
+        return {normalize_url(row["url"]) for row in cursor}
+
+    def _items_prune(self, name: str, url: Union[str, None] = None):
+        """
+        delete the stored items of the feeds no subscription polls, when the subscription
+        of name is changed to url, or deleted without url. the writes of the batch are not read yet
+        """
+        feeds = {
+            normalize_url(row["url"])
+            for row in self.conn.execute("SELECT url FROM subscribe WHERE name != ?", (name, ))}
+        if url is not None:
+            feeds.add(normalize_url(url))
+        for row in self.conn.execute("SELECT DISTINCT feed FROM items").fetchall():
+            if row["feed"] not in feeds:
+                self._execute("DELETE FROM items WHERE feed = ?", (row["feed"], ))
 
     def subscribe_list(self):
         cursor = self.conn.execute("SELECT * FROM subscribe")
@@ -73,33 +359,181 @@ CREATE TABLE downloaded(
         ret = cursor.fetchone()
         return Subscribe(**ret)
 
-    def download_add(self, url: str, local_torrent: Union[str, None] = None):
-        self.conn.execute(
-            "INSERT INTO downloaded VALUES(?,?,?)",
-            (url, str(datetime.now().replace(microsecond=0)), local_torrent))
-        self.conn.commit()
+    def subscribe_mark_get(self, name: str):
+        cursor = self.conn.execute(
+            "SELECT name, gui, torrent FROM subscribe_mark WHERE name = ?", (name, ))
+        row = cursor.fetchone()
+        if row:
+            return SubscribeMark(**row)
+        return None
+
+    def subscribe_mark_set(self, mark: SubscribeMark):
+        self._execute(
+            "REPLACE INTO subscribe_mark VALUES(?,?,?)",
+            (mark.name, mark.gui, mark.torrent))
+
+    def items_add(self, feed: str, items: Iterable[FeedItem], committed: Union[Callable[[], None], None] = None):
+        """
+        items of one poll, newest first. the first_seen of a known item is kept,
+        only the newest config.feed_items_keep items of the feed are kept.
+        committed is called after they are committed
+        """
+        items = list(items)
+        if not items:
+            return
+        with self.batch():
+            for item in reversed(items):  # the newer items get the larger rowid
+                self._execute(
+                    "INSERT INTO items(feed, gui, title, torrent, description, first_seen) VALUES(?,?,?,?,?,?) "
+                    "ON CONFLICT(feed, torrent) DO UPDATE SET gui = excluded.gui, title = excluded.title, description = excluded.description",
+                    (feed, item.gui, item.title, item.torrent, item.description, str(item.first_seen.replace(microsecond=0))))
+            self._execute(
+                "DELETE FROM items WHERE feed = ? AND rowid NOT IN "
+                "(SELECT rowid FROM items WHERE feed = ? ORDER BY rowid DESC LIMIT ?)",
+                (feed, feed, max(config.feed_items_keep, 0)), committed)
+
+    def items_get(self, feed: str) -> List[FeedItem]:
+        """
+        the items of a feed, newest first
+        """
+        cursor = self.conn.execute(
+            "SELECT * FROM items WHERE feed = ? ORDER BY rowid DESC", (feed, ))
+        return [FeedItem(**row) for row in cursor]
+
+    def schedule_list(self):
+        cursor = self.conn.execute("SELECT name, next_run, idle FROM schedule")
+        for row in cursor.fetchall():
+            yield Schedule(**row)
+
+    def schedule_set(self, schedule: Schedule):
+        self._execute(
+            "REPLACE INTO schedule VALUES(?,?,?)",
+            (schedule.name, str(schedule.next_run.replace(microsecond=0)), schedule.idle))
+
+    def download_add(
+            self, url: str, local_torrent: Union[str, None] = None,
+            subscribe: Union[str, None] = None, info_hash: Union[str, None] = None):
+        """
+        subscribe is the subscription downloading it, None for the ones marked by hand
+        """
+        def committed():
+            _known_urls.add(url)
+            if info_hash:
+                _known_hashes.add(info_hash)
+        self._execute(
+            "INSERT INTO downloaded(url, dt, local_torrent, subscribe, info_hash) VALUES(?,?,?,?,?)",
+            (url, str(datetime.now().replace(microsecond=0)), local_torrent, subscribe, info_hash), committed)
 
-    def download_assign(self, url: str, local_torrent: Union[str, None] = None):
-        self.conn.execute(
-            "UPDATE downloaded SET local_torrent = ? WHERE url = ?", (local_torrent, url))
-        self.conn.commit()
+    def download_assign(self, url: str, local_torrent: Union[str, None] = None, info_hash: Union[str, None] = None):
+        """
+        the info hash is kept if not given
+        """
+        if info_hash:
+            self._execute(
+                "UPDATE downloaded SET local_torrent = ?, info_hash = ? WHERE url = ?", (local_torrent, info_hash, url),
+                lambda: _known_hashes.add(info_hash))
+        else:
+            self._execute(
+                "UPDATE downloaded SET local_torrent = ? WHERE url = ?", (local_torrent, url))
 
     def download_exist(self, url: str):
+        return url in _known_urls
+
+    def download_hash_exist(self, info_hash: Union[str, None]):
+        """
+        whether the same torrent was downloaded, maybe from another url
+        """
+        return bool(info_hash) and info_hash in _known_hashes
+
+    def download_exist_many(self, urls: Iterable[str]) -> Set[str]:
+        """
+        the downloaded ones among urls
+        """
+        return _known_urls.intersection(urls)
+
+    def download_times_all(self, limit: int = 50) -> Dict[str, List[datetime]]:
+        """
+        the latest download times of every subscription in one query.
+        the subscriptions without downloads are not in it
+        """
         cursor = self.conn.execute(
-            "SELECT * FROM downloaded WHERE url = ?", (url, ))
-        return cursor.fetchone() is not None
+            "SELECT subscribe, dt FROM ("
+            "SELECT subscribe, dt, ROW_NUMBER() OVER (PARTITION BY subscribe ORDER BY dt DESC) AS n "
+            "FROM downloaded WHERE subscribe IS NOT NULL) WHERE n <= ? ORDER BY subscribe, dt DESC", (limit, ))
+        ret: Dict[str, List[datetime]] = {}
+        for row in cursor:
+            ret.setdefault(row["subscribe"], []).append(datetime.fromisoformat(row["dt"]))
+        return ret
 
     def download_get(self, url: str):
         cursor = self.conn.execute(
-            "SELECT url, dt, local_torrent FROM downloaded WHERE url = ?", (url, ))
+            "SELECT url, dt, local_torrent, info_hash FROM downloaded WHERE url = ?", (url, ))
         row = cursor.fetchone()
         if row:
             return DownloadTorrent(**row)
         return None
 
+    def download_get_many(self, urls: Iterable[str]) -> Dict[str, DownloadTorrent]:
+        urls = list(self.download_exist_many(urls))
+        ret: Dict[str, DownloadTorrent] = {}
+        for i in range(0, len(urls), _BATCH):
+            batch = urls[i:i+_BATCH]
+            cursor = self.conn.execute(
+                f"SELECT url, dt, local_torrent, info_hash FROM downloaded WHERE url IN ({','.join('?' * len(batch))})", batch)
+            for row in cursor:
+                ret[row["url"]] = DownloadTorrent(**row)
+        return ret
+
+    def feed_cache_get(self, url: str):
+        cursor = self.conn.execute(
+            "SELECT url, etag, last_modified FROM feed_cache WHERE url = ?", (url, ))
+        row = cursor.fetchone()
+        if row:
+            return FeedCache(**row)
+        return FeedCache(url=url)
+
+    def feed_cache_set(self, cache: FeedCache):
+        self._execute(
+            "REPLACE INTO feed_cache VALUES(?,?,?)",
+            (cache.url, cache.etag, cache.last_modified))
+
+    def webhook_queue_add(self, messages: Iterable[WebhookMessage]):
+        with self.batch():
+            for message in messages:
+                self._execute(
+                    "INSERT INTO webhook_queue(type, url, body, tries, next_try) VALUES(?,?,?,?,?)",
+                    (message.type, message.url, message.body, message.tries,
+                     str(message.next_try.replace(microsecond=0))))
+
+    def webhook_queue_due(self, now: datetime):
+        """
+        the due messages in order, the messages of a url after one waiting for its retry are held back
+        """
+        now = str(now.replace(microsecond=0))
+        cursor = self.conn.execute(
+            "SELECT * FROM webhook_queue AS q WHERE next_try <= ? AND NOT EXISTS ("
+            "SELECT 1 FROM webhook_queue AS w WHERE w.url = q.url AND w.id < q.id AND w.next_try > ?) ORDER BY id",
+            (now, now))
+        for row in cursor.fetchall():
+            yield WebhookMessage(**row)
+
+    def webhook_queue_retry(self, id: int, tries: int, next_try: datetime):
+        self._execute(
+            "UPDATE webhook_queue SET tries = ?, next_try = ? WHERE id = ?",
+            (tries, str(next_try.replace(microsecond=0)), id))
+
+    def webhook_queue_del(self, id: int):
+        self._execute("DELETE FROM webhook_queue WHERE id = ?", (id, ))
+
 
 @contextmanager
 def Connection():
-    exist = sql_path.exists()
-    with sqlite3.Connection(sql_path, check_same_thread=False) as conn:
-        yield _Sql(conn, exist)
+    conn = _pool.acquire()
+    try:
+        yield _Sql(conn)
+    finally:
+        _pool.release(conn)
+
+
+def close():
+    _pool.close()
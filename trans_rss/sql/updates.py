@@ -4,7 +4,7 @@ from ..logger import logger
 
 TAG = "Sql_Updates"
 
-version = "0.5.11"
+version = "0.6.7"
 
 def update_to_0_3_0(conn: Connection):
     conn.execute("ALTER TABLE downloaded ADD id INT")
@@ -26,11 +26,81 @@ def update_to_0_5_11(conn: Connection):
     conn.execute("ALTER TABLE subscribe ADD COLUMN exclude_words TEXT")
     conn.execute('UPDATE subscribe SET include_words = "", exclude_words = ""')
 
+def update_to_0_6_0(conn: Connection):
+    conn.execute("""
+CREATE TABLE feed_cache(
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT) """)
+
+
+def update_to_0_6_1(conn: Connection):
+    conn.execute("""
+CREATE TABLE subscribe_mark(
+    name VARCHAR(20) PRIMARY KEY,
+    gui TEXT,
+    torrent TEXT) """)
+
+
+def update_to_0_6_2(conn: Connection):
+    conn.execute("""
+CREATE TABLE webhook_queue(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    type TEXT,
+    url TEXT,
+    body TEXT,
+    tries INTEGER,
+    next_try datetime) """)
+
+
+def update_to_0_6_3(conn: Connection):
+    conn.execute("ALTER TABLE subscribe ADD COLUMN minutes INTEGER DEFAULT 0")
+    conn.execute("""
+CREATE TABLE schedule(
+    name VARCHAR(20) PRIMARY KEY,
+    next_run datetime,
+    idle INTEGER) """)
+
+
+def update_to_0_6_4(conn: Connection):
+    conn.execute("ALTER TABLE downloaded ADD COLUMN subscribe VARCHAR(20)")
+    conn.execute("CREATE INDEX downloaded_subscribe ON downloaded(subscribe, dt)")
+
+
+def update_to_0_6_5(conn: Connection):
+    conn.execute("ALTER TABLE subscribe ADD COLUMN word_regex INTEGER DEFAULT 0")
+    conn.execute("ALTER TABLE subscribe ADD COLUMN word_normalize INTEGER DEFAULT 0")
+
+
+def update_to_0_6_6(conn: Connection):
+    conn.execute("""
+CREATE TABLE items(
+    feed TEXT,
+    gui TEXT,
+    title TEXT,
+    torrent TEXT,
+    description TEXT,
+    first_seen datetime,
+    PRIMARY KEY(feed, torrent)) """)
+
+
+
+def update_to_0_6_7(conn: Connection):
+    conn.execute("ALTER TABLE downloaded ADD COLUMN info_hash VARCHAR(40)")
+    conn.execute("CREATE INDEX downloaded_info_hash ON downloaded(info_hash)")
 
 updaters = [
     (Version("0.3.0"), update_to_0_3_0),
     (Version("0.5.2"), update_to_0_5_2),
-    (Version("0.5.11"), update_to_0_5_11)
+    (Version("0.5.11"), update_to_0_5_11),
+    (Version("0.6.0"), update_to_0_6_0),
+    (Version("0.6.1"), update_to_0_6_1),
+    (Version("0.6.2"), update_to_0_6_2),
+    (Version("0.6.3"), update_to_0_6_3),
+    (Version("0.6.4"), update_to_0_6_4),
+    (Version("0.6.5"), update_to_0_6_5),
+    (Version("0.6.6"), update_to_0_6_6),
+    (Version("0.6.7"), update_to_0_6_7)
 ]
 
 assert Version(version) == updaters[-1][0]
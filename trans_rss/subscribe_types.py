@@ -1,13 +1,17 @@
+import codecs
 from functools import cached_property
 import json
 from pathlib import Path
 import re
 from types import NoneType
-from typing import Dict, Generator, List, Literal, Tuple, TypeVar, Union, get_args
+from typing import Callable, Dict, Generator, Iterable, List, Literal, Tuple, TypeVar, Union, get_args
 from xml.dom.minidom import Element
+from xml.etree.ElementTree import Element as StreamElement
+from xml.parsers import expat
 
 from pydantic import BaseModel, BaseConfig
 
+from .common import cache
 from .config import subscribe_dir, subscribe_builtin_dir
 
 Keys = Literal["title", "gui", "torrent", "description"]
@@ -70,6 +74,212 @@ def get_text(node: Element, path: List[Tuple[Actions, Union[str, None]]], defaul
 
 
 
+# CDATA sections are kept as children with this tag, which never matches a "Node" path
+CDATA = "![CDATA["
+
+_DECLARATION = re.compile(rb"""^(?:\xef\xbb\xbf)?\s*<\?xml[^>]*?encoding\s*=\s*["']([A-Za-z][\w.:-]*)["']""")
+# expat reads these by itself, the feeds in other encodings are decoded before parsing
+_EXPAT_ENCODINGS = {"utf-8", "ascii", "iso8859-1", "utf-16"}
+# the feeds declared as gb2312 often have gbk characters, read them as gb18030 like the browsers
+_SUPERSETS = {"gb2312": "gb18030", "gbk": "gb18030"}
+
+
+def _decode_chunks(chunks: Iterable[Union[str, bytes]], encoding: Union[str, None] = None) -> Generator[Union[str, bytes], None, None]:
+    """
+    pass the chunks through when expat reads their encoding, otherwise decode them incrementally.
+    encoding is the charset of the response, the xml declaration is used without it
+    """
+    chunks = iter(chunks)
+    head = next(chunks, b"")
+    if isinstance(head, str):
+        yield head
+        yield from chunks
+        return
+    while b">" not in head and len(head) < 1024:  # the declaration is the first tag
+        chunk = next(chunks, None)
+        if chunk is None:
+            break
+        head += chunk
+    match = _DECLARATION.match(head)
+    declared = match.group(1).decode() if match else None
+    try:
+        declared_codec = codecs.lookup(_SUPERSETS.get(declared.lower(), declared)) if declared else None
+        codec = codecs.lookup(_SUPERSETS.get(encoding.lower(), encoding)) if encoding else declared_codec
+    except LookupError:
+        codec = None  # expat raises its own error if it does not know it either
+    if codec is None or codec.name in _EXPAT_ENCODINGS and (
+            declared_codec is None or declared_codec.name in _EXPAT_ENCODINGS):
+        yield head
+        yield from chunks
+        return
+    # str is always parsed as utf-8, whatever the declaration says
+    decoder = codecs.getincrementaldecoder(codec.name)("replace")
+    yield decoder.decode(head)
+    for chunk in chunks:
+        yield decoder.decode(chunk)
+    yield decoder.decode(b"", True)
+
+
+def iter_items(content: Union[str, bytes, Iterable[bytes]], tag: str = "item", encoding: Union[str, None] = None) -> Generator[StreamElement, None, None]:
+    """
+    parse the feed incrementally and yield every <item> as soon as it is closed.
+    only the elements inside an item are built, and each item is dropped after yield.
+    tag names keep their prefix (e.g. nyaa:seeders) like minidom's tagName.
+    encoding is the charset of the response if it gives one.
+    """
+    if isinstance(content, (str, bytes)):
+        content = [content]
+    content = _decode_chunks(content, encoding)
+    parser = expat.ParserCreate()
+    parser.buffer_text = True
+    stack: List[StreamElement] = []
+    closed: List[StreamElement] = []
+
+    def start(name: str, attrs: Dict[str, str]):
+        if stack:
+            child = StreamElement(name, attrs)
+            stack[-1].append(child)
+            stack.append(child)
+        elif name == tag:
+            stack.append(StreamElement(name, attrs))
+
+    def end(name: str):
+        if stack:
+            node = stack.pop()
+            if not stack:
+                closed.append(node)
+
+    def start_cdata():
+        if stack:
+            start(CDATA, {})
+
+    def end_cdata():
+        if stack:
+            stack.pop()
+
+    def data(text: str):
+        if not stack:
+            return
+        node = stack[-1]
+        if len(node):
+            last = node[-1]
+            last.tail = (last.tail or "") + text
+        else:
+            node.text = (node.text or "") + text
+
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.CharacterDataHandler = data
+    parser.StartCdataSectionHandler = start_cdata
+    parser.EndCdataSectionHandler = end_cdata
+
+    for chunk in content:
+        parser.Parse(chunk, False)
+        yield from closed
+        closed.clear()
+    parser.Parse(b"", True)
+    yield from closed
+    closed.clear()
+
+
+def _escape(data: str):
+    # the same escaping as minidom's toxml
+    return data.replace("&", "&amp;").replace("<", "&lt;").replace("\"", "&quot;").replace(">", "&gt;")
+
+
+def _iter_stream_xml(node: StreamElement) -> Generator[str, None, None]:
+    if node.tag == CDATA:
+        yield f"<![CDATA[{node.text or ''}]]>"
+        return
+    yield f"<{node.tag}"
+    for key, value in node.attrib.items():
+        yield f' {key}="{_escape(value)}"'
+    if node.text or len(node):
+        yield ">"
+        yield from iter_stream_xml(node)
+        yield f"</{node.tag}>"
+    else:
+        yield "/>"
+
+
+def iter_stream_xml(node: StreamElement) -> Generator[str, None, None]:
+    """
+    the children of a streamed node, serialized like iter_xml
+    """
+    if node.text:
+        yield _escape(node.text)
+    for child in node:
+        yield "".join(_iter_stream_xml(child))
+        if child.tail:
+            yield _escape(child.tail)
+
+
+Extractor = Callable[[StreamElement], Dict[Keys, str]]
+
+
+def _compile_path(path: List[Tuple[Actions, Union[str, None]]], default) -> Callable[[StreamElement], str]:
+    if not path:
+        return lambda node: default
+    match path[0]:
+        case "Node", tag:
+            rest = _compile_path(path[1:], default)
+
+            def get_node(node: StreamElement):
+                for child in node:
+                    if child.tag == tag:
+                        return rest(child)
+                return default
+            return get_node
+        case "Attr", attr:
+            return lambda node: node.get(attr, default)
+        case "XML", _:
+            return lambda node: "".join(iter_stream_xml(node)).strip()
+        case "Plain", _:
+            return lambda node: "".join(node.itertext()).strip()
+    return lambda node: default
+
+
+def compile_paths(paths: Dict[Keys, List[Tuple[Actions, Union[str, None]]]], default="未找到") -> Extractor:
+    """
+    compile the paths into one function, which gets the texts of all keys
+    with a single pass over the children of an item of iter_items
+    """
+    defaults: Dict[Keys, str] = {key: default for key in get_args(Keys)}
+    on_item: List[Tuple[Keys, Callable[[StreamElement], str]]] = []
+    on_child: Dict[str, List[Tuple[Keys, Callable[[StreamElement], str]]]] = {}
+    for key in get_args(Keys):
+        path = paths.get(key, [])
+        if not path:
+            continue
+        match path[0]:
+            case "Node", tag:
+                on_child.setdefault(tag, []).append(
+                    (key, _compile_path(path[1:], default)))
+            case _:
+                on_item.append((key, _compile_path(path, default)))
+
+    def extract(node: StreamElement) -> Dict[Keys, str]:
+        texts = defaults.copy()
+        for key, func in on_item:
+            texts[key] = func(node)
+        if on_child:
+            found = set()
+            for child in node:
+                tag = child.tag
+                if tag in found:  # only the first node with the tag is used
+                    continue
+                funcs = on_child.get(tag)
+                if funcs is None:
+                    continue
+                for key, func in funcs:
+                    texts[key] = func(child)
+                found.add(tag)
+                if len(found) == len(on_child):
+                    break
+        return texts
+    return extract
+
+
 class SubscribeType(BaseModel):
     builtin: bool = True
     hostname: str = ""
@@ -102,10 +312,13 @@ class SubscribeType(BaseModel):
 
 
 _subscribe_types: Dict[str, SubscribeType] = {}
+# compiled from the templates when first used
+_extractors: "cache.Cache[Extractor]" = cache.create("extractors", 64)
 
 
 def init():
     _subscribe_types.clear()
+    _extractors.clear()
 
     def load_from(dir: Path):
         for path in dir.glob("*.json"):
@@ -119,6 +332,7 @@ def _try_add_from_file(file: Path):
     if file.exists():
         st = SubscribeType.parse_file(file)
         _subscribe_types[st.hostname] = st
+        _extractors.pop(st.hostname)
 
 
 def list():
@@ -129,17 +343,26 @@ def add(st: SubscribeType):
     with (subscribe_dir / st.filename).open("w", encoding='utf-8') as w:
         json.dump(st.dict(exclude={"filename"}), w, ensure_ascii=False, indent=4)
     _subscribe_types[st.hostname] = st
+    _extractors.pop(st.hostname)
 
 
 def get(hostname: str):
     return _subscribe_types.get(hostname)
 
 
+def get_extractor(hostname: str):
+    st = _subscribe_types.get(hostname)
+    if st is None:
+        return None
+    return _extractors.get_or_set(hostname, lambda: compile_paths(st.paths))
+
+
 def remove(hostname: str):
     st = _subscribe_types[hostname]
     assert not st.builtin
     (subscribe_dir / st.filename).unlink(True)
     st = _subscribe_types.pop(hostname)
+    _extractors.pop(hostname)
     _try_add_from_file(subscribe_builtin_dir / st.filename)
 
 
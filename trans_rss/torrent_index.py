@@ -0,0 +1,122 @@
+import threading
+import time
+from typing import Dict, List, Union
+
+from transmission_rpc import Torrent
+
+from .common import metrics
+from .config import config
+from .logger import logger
+
+TAG = "TorrentIndex"
+
+# only the fields used by the pages and the updates
+FIELDS = ["id", "name", "hashString", "torrentFile", "status", "percentDone"]
+
+_lock = threading.Lock()
+_by_id: Dict[int, Torrent] = {}
+_by_file: Dict[str, int] = {}
+_by_hash: Dict[str, int] = {}
+_full_at: Union[float, None] = None
+_refreshed_at: Union[float, None] = None
+_thread: threading.Thread = None
+
+
+def _put(torrent: Torrent):
+    old = _by_id.get(torrent.id)
+    if old is not None:
+        _drop(old)
+    _by_id[torrent.id] = torrent
+    if torrent.fields.get("torrentFile"):
+        _by_file[torrent.torrent_file] = torrent.id
+    _by_hash[torrent.hashString.lower()] = torrent.id
+
+
+def _drop(torrent: Torrent):
+    _by_id.pop(torrent.id, None)
+    if torrent.fields.get("torrentFile"):
+        _by_file.pop(torrent.torrent_file, None)
+    _by_hash.pop(torrent.hashString.lower(), None)
+
+
+def refresh(full=False):
+    """
+    update the index with the recently active torrents of transmission,
+    or reload all torrents when full or the last full reload is too old
+    """
+    global _full_at, _refreshed_at
+    with metrics.TRANSMISSION_SECONDS.time(method="session-get"):
+        client = config.transmission.client()
+    now = time.monotonic()
+    if full or _full_at is None or now - _full_at > config.transmission.index_full_seconds:
+        with metrics.TRANSMISSION_SECONDS.time(method="torrent-get"):
+            torrents = client.get_torrents(arguments=FIELDS)
+        with _lock:
+            _by_id.clear()
+            _by_file.clear()
+            _by_hash.clear()
+            for torrent in torrents:
+                _put(torrent)
+            _full_at = _refreshed_at = now
+        logger.debug(TAG, f"refresh full {len(torrents)}")
+        return
+    with metrics.TRANSMISSION_SECONDS.time(method="torrent-get"):
+        active, removed = client.get_recently_active_torrents(FIELDS)
+    with _lock:
+        for torrent in active:
+            _put(torrent)
+        for id in removed:
+            torrent = _by_id.get(id)
+            if torrent is not None:
+                _drop(torrent)
+        _refreshed_at = now
+    logger.debug(TAG, f"refresh active {len(active)} removed {len(removed)}")
+
+
+def fresh(seconds: float = 10):
+    """
+    refresh if the index is older than seconds
+    """
+    if _refreshed_at is None or time.monotonic() - _refreshed_at > seconds:
+        refresh()
+
+
+def by_id(id: int):
+    with _lock:
+        return _by_id.get(id)
+
+
+def by_file(torrent_file: Union[str, None]):
+    with _lock:
+        id = _by_file.get(torrent_file)
+        return _by_id.get(id) if id is not None else None
+
+
+def by_hash(info_hash: Union[str, None]):
+    if not info_hash:
+        return None
+    with _lock:
+        id = _by_hash.get(info_hash.lower())
+        return _by_id.get(id) if id is not None else None
+
+
+def torrents() -> List[Torrent]:
+    with _lock:
+        return list(_by_id.values())
+
+
+def start():
+    def refresher():
+        while True:
+            time.sleep(config.transmission.index_seconds)
+            if config.without_transmission:
+                continue
+            try:
+                refresh()
+            except Exception:
+                logger.exception(TAG, "refresh failed")
+
+    global _thread
+    if _thread is None:
+        _thread = threading.Thread(target=refresher, daemon=True)
+        _thread.start()
@@ -7,6 +7,7 @@ from .logs import log_page
 from .manage import manage_subscribe_page
 from .subscribe import sub_list_page, subscribe_page
 from .subscribe_type import subscribe_type_page
+from .trace import trace_page
 from .webhook_type import webhook_type_page
 
 routes = webio_routes(
@@ -15,6 +16,7 @@ routes = webio_routes(
         "sub-list": sub_list_page,
         "subscribe": subscribe_page,
         "log": log_page,
+        "trace": trace_page,
         "config": config_page,
         "subscribe-manage": manage_subscribe_page,
         "webhook-type": webhook_type_page,
@@ -4,12 +4,11 @@ from functools import partial, wraps
 from queue import Queue
 from typing import Literal
 
-import requests
 from pywebio import output, session, exceptions
 
 from trans_rss.config import config
 
-from ..common import toast_message
+from ..common import http_client, toast_message
 from ..logger import logger
 
 TAG = "Web_Common"
@@ -20,10 +19,11 @@ def generate_header():
         from trans_rss.actions import update_timer
         row = [
             output.put_buttons(
-                ["订阅列表", "日志", "配置", "API page"],
+                ["订阅列表", "日志", "耗时", "配置", "API page"],
                 onclick=[
                     lambda: session.go_app("sub-list", False),
                     lambda: session.go_app("log", False),
+                    lambda: session.go_app("trace", False),
                     lambda: session.go_app("config", False),
                     lambda: session.run_js(
                         'window.open("/docs", "_blank")')
@@ -91,4 +91,4 @@ def button(label, value=None, color: Literal["primary", "secondary", "success",
 
 
 def requests_get(url: str):
-    return requests.get(url, timeout=3, headers=config.get_headers(), proxies=config.get_proxies())
+    return http_client.get(url, timeout=3)
@@ -6,12 +6,11 @@ from pydantic import BaseModel
 
 import pytz
 import pywebio
-import requests
 from pywebio import input, output, pin, session
 
 from trans_rss import webhook_types
 from trans_rss.logger import logger
-from trans_rss.common import executor
+from trans_rss.common import executor, http_client
 from trans_rss.sql.sql import Connection
 from trans_rss.web.subscribe_type import requests_get
 
@@ -26,7 +25,7 @@ TAG = "Web_Config"
 async def test_transmission():
     try:
         client = config.transmission.client(5)
-        torrents = client.get_torrents()
+        torrents = client.get_torrents(arguments=["id", "name"])
         output.toast(f"Transmission共有{len(torrents)}个种子正在下载")
         if torrents:
             output.toast(f"Transmission下载的某个种子为{torrents[0].name}")
@@ -130,7 +129,7 @@ async def generate_webhooks():
 
 def webhook_noti(type: str, url: str, body: bytes):
     try:
-        resp = requests.post(
+        resp = http_client.post(
             url, headers={"Content-Type": "application/json"}, data=body, timeout=3)
         if 200 <= resp.status_code <= 299:
             logger.info(
@@ -234,6 +233,14 @@ async def wait_update_configs():
                     options=[{"label": "是", "value": True},
                              {"label": "否", "value": False}],
                     value=config.auto_page, help_text="不同种子站的翻页规则不一致，之后会添加不同站的翻页支持"),
+        input.input(
+            "同时更新的订阅数", input.NUMBER, name="update_concurrency",
+            value=config.update_concurrency
+        ),
+        input.input(
+            "同一网站同时更新的订阅数", input.NUMBER, name="update_host_concurrency",
+            value=config.update_host_concurrency, help_text="过大可能会被种子站限流"
+        ),
         input.input(
             "时区", datalist=pytz.all_timezones, name="timezone",
             value=config.timezone, validate=lambda v: None if v in pytz.all_timezones else "时区错误"),
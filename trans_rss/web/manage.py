@@ -1,19 +1,17 @@
 import asyncio
-from datetime import datetime, timedelta
 from functools import partial
-from typing import Dict, List, Literal
+from typing import Literal
 
-from transmission_rpc import TransmissionError
+from transmission_rpc import Torrent, TransmissionError
 import pywebio
-from pydantic import BaseModel
 from pywebio import input, output, session
 
 from trans_rss.common import executor
 
-from .. import actions
+from .. import actions, torrent_index
 from ..config import config
 from ..logger import logger
-from ..sql import Connection, Subscribe
+from ..sql import Connection
 from .common import catcher, generate_header, button, requests_get
 
 TAG = "Web_Manage"
@@ -32,20 +30,17 @@ async def try_download(title: str, torrent_url: str, dir:str):
     try:
         resp = await executor.run_in_thread(requests_get, torrent_url)
         torrent = client.add_torrent(resp.content, download_dir=dir, paused=True)
-
-        await asyncio.sleep(1)
-        torrent = client.get_torrent(torrent.id)
-
         logger.info(TAG, f"try_download url {torrent_url} title {title} id {torrent.id}")
         output.toast(f"添加新任务 {title}，请手动开始")
     except TransmissionError as e:
         resp = e.response
         assert "duplicate torrent" == resp["result"]
-        torrent_id = resp["arguments"]["torrent-duplicate"]["id"]
-        torrent = client.get_torrent(torrent_id)
+        torrent = Torrent(fields=resp["arguments"]["torrent-duplicate"])
         logger.info(TAG, f"try_download retrieve url {torrent_url} title {title} id {torrent.id}")
     with Connection() as conn:
-        conn.download_assign(torrent_url, torrent.torrent_file)
+        # linked by the info hash, the local torrent file is not needed
+        conn.download_assign(torrent_url, None, torrent.hashString)
+    await executor.run_in_io(torrent_index.refresh)
 
     await refresh()
 
@@ -75,6 +70,8 @@ async def manage_download(title: str, id: int, torrent_url: str, action: Literal
                 conn.download_assign(torrent_url, None)
             config.transmission.client().remove_torrent(id, True)
             output.toast(f"已在transmission中删除 {title}")
+    if not config.without_transmission:
+        await executor.run_in_io(torrent_index.refresh)
 
     await refresh()
 
@@ -95,19 +92,20 @@ async def manage_subscribe_page():
         sub = conn.subscribe_get(name)
         output.put_markdown(f"# [{name}]({sub.url}) 的订阅")
         if not config.without_transmission:
-            trans_client = config.transmission.client()
-            torrents = {t.torrent_file: t for t in trans_client.get_torrents()}
-        else:
-            torrents = {}
-        async for clear, item in subscribe_and_cache(sub):
+            await executor.run_in_io(torrent_index.fresh)
+        with output.use_scope("manage", True):
+            output.put_text("正在获取订阅…")
+        items = [item async for item in executor.iter_in_thread(actions.subscribe_stored, sub)]
+        downloads = conn.download_get_many(item.torrent for item in items)
+        for item in items:
             row = [
                 output.put_link(item.title, item.gui, new_window=True),
                 output.put_link("种子", item.torrent, new_window=True)
             ]
-            download = conn.download_get(item.torrent)
+            download = downloads.get(item.torrent)
             if download:
                 row.append(output.put_text(str(download.dt)))
-                torrent = torrents.get(download.local_torrent, None)
+                torrent = torrent_index.by_hash(download.info_hash) or torrent_index.by_file(download.local_torrent)
                 if torrent is not None:
                     row.extend([
                         output.put_text(torrent.status, torrent.progress),
@@ -133,41 +131,5 @@ async def manage_subscribe_page():
                         "添加下载", partial(try_download, item.title, item.torrent, config.join(sub.name)))
                 ])
             table.append(row)
-            if clear:
-                with output.use_scope("manage", True):
-                    output.put_table(table)
         with output.use_scope("manage", True):
             output.put_table(table)
-
-
-class Cache(BaseModel):
-    dt: datetime
-    rets: List[actions.RSSParseResult]
-
-
-caches: Dict[str, Cache] = {}
-
-
-async def subscribe_and_cache(sub: Subscribe):
-    now = datetime.now()
-    hour = timedelta(hours=1)
-    need_sub = True
-    if sub.url in caches:
-        cache = caches[sub.url]
-        if now - cache.dt < hour:
-            need_sub = False
-            for ret in cache.rets:
-                yield False, ret
-    cache = Cache(dt=now, rets=[])
-    if need_sub:
-        async for ret in executor.iter_in_thread(actions.subscribe, sub):
-            cache.rets.append(ret)
-            yield True, ret
-        caches[sub.url] = cache
-
-    for url, cache in list(caches.items()):
-        if now - cache.dt > hour:
-            caches.pop(url)
-
-async def clear_cache(sub: Subscribe):
-    caches.pop(sub.url, None)
\ No newline at end of file
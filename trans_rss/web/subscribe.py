@@ -1,15 +1,16 @@
+from datetime import datetime
+import re
 from functools import partial
 from typing import Literal
 import pywebio
 from pywebio import input, output, session
 
-from .. import actions
+from .. import actions, torrent_index
 from ..sql import Connection, Subscribe
-from ..common import executor, sub_status
+from ..common import cadence, executor, sub_status
 from ..config import config
 
 from .common import button, generate_header, catcher
-from .manage import subscribe_and_cache, clear_cache
 from trans_rss.logger import logger
 
 TAG = "Web_Subscribe"
@@ -39,13 +40,14 @@ async def subscribe_del(name: str, url: str):
             logger.warn(
                 TAG, f"subscribe_del del-torrent:True del-file:{del_file} {name} {sub.url}")
             trans_client = config.transmission.client()
-            torrents = {
-                t.torrent_file: t for t in trans_client.get_torrents()}
-            async for _, item in subscribe_and_cache(sub):
-                download = conn.download_get(item.torrent)
+            await executor.run_in_io(torrent_index.fresh)
+            items = [item async for item in executor.iter_in_thread(actions.subscribe_stored, sub)]
+            downloads = conn.download_get_many(item.torrent for item in items)
+            for item in items:
+                download = downloads.get(item.torrent)
                 if download is None:
                     continue
-                torrent = torrents.get(download.local_torrent, None)
+                torrent = torrent_index.by_hash(download.info_hash) or torrent_index.by_file(download.local_torrent)
                 if torrent is None:
                     output.toast(f"未找到对应的种子，跳过：{item.title}")
                 else:
@@ -59,7 +61,7 @@ async def subscribe_del(name: str, url: str):
                             f"已删除对应的种子：{item.title}", color="success")
                     logger.warn(
                         TAG, f"subscribe_del del-torrent {item.torrent} {item.title}")
-            clear_cache(sub)
+            await executor.run_in_io(torrent_index.refresh)
 
         logger.warn(TAG, f"subscribe_del del-sub {name} {sub.url}")
         conn.subscribe_del(name)
@@ -104,13 +106,19 @@ async def update_manual():
 
 def generate_sub_table():
     with output.use_scope("table", True), Connection() as conn:
-        table = ["名称 最新话 更新时间 轮询时间 操作".split()]
-        for sub in conn.subscribe_list():
+        table = ["名称 最新话 更新时间 轮询时间 预计更新 操作".split()]
+        now = datetime.now()
+        subs = list(conn.subscribe_list())
+        statuses = {sub.name: sub_status.status_get(sub.name) for sub in subs}
+        downloads = conn.download_get_many(
+            ss.torrent for ss in statuses.values() if ss is not None)
+        times = conn.download_times_all()
+        for sub in subs:
             row = [output.put_link(
                 sub.name, f"/web/?app=subscribe-manage&name={sub.name}")]
-            ss = sub_status.status_get(sub.name)
+            ss = statuses[sub.name]
             if ss is not None:
-                download = conn.download_get(ss.torrent)
+                download = downloads.get(ss.torrent)
                 row.extend([
                     output.put_link(ss.title, ss.link, new_window=True),
                     output.put_link(
@@ -122,6 +130,8 @@ def generate_sub_table():
                     output.put_text(""),
                     output.put_text(""),
                 ])
+            release = cadence.estimate(times.get(sub.name, []))
+            row.append(output.put_text(release.describe(now) if release else ""))
             row.append(
                 output.put_button("删除", partial(subscribe_del, sub.name, sub.url), "danger"))
             table.append(row)
@@ -150,6 +160,17 @@ async def sub_list_page():
     )
 
 
+def validate_words(data: dict):
+    if "regex" not in data["word_modes"]:
+        return None
+    for name in ["include_words", "exclude_words"]:
+        for word in data[name].split():
+            try:
+                re.compile(word)
+            except re.error as e:
+                return name, f"正则表达式错误 {word}：{e}"
+
+
 @pywebio.config(title="Trans RSS 添加新订阅", theme="dark")
 @catcher
 async def subscribe_page():
@@ -167,16 +188,22 @@ async def subscribe_page():
                             help_text="使用空格分开"),
                 input.input("排除的词", name="exclude_words",
                             help_text="使用空格分开"),
-            ]
+                input.input("轮询时间（分钟）", input.NUMBER, name="minutes", value=0,
+                            help_text="0为使用配置中的轮询时间，长期无更新时会逐渐延长"),
+                input.checkbox("匹配方式", name="word_modes", options=[
+                    {"label": "使用正则表达式", "value": "regex"},
+                    {"label": "忽略大小写及全角半角", "value": "normalize"}]),
+            ], validate=validate_words
         )
 
-        sub = Subscribe(**data)
+        modes = data.pop("word_modes")
+        sub = Subscribe(**data, word_regex="regex" in modes, word_normalize="normalize" in modes)
         sub.url = sub.url.strip()
         sub.include_words = sub.include_words.strip()
         sub.exclude_words = sub.exclude_words.strip()
         sub_all = partial(subscribe_all, sub)
         output.put_button("全部订阅", onclick=sub_all)
-        async for item in executor.iter_in_thread(actions.subscribe, sub):
+        async for item in executor.iter_in_thread(actions.subscribe_stored, sub):
             if conn.download_exist(item.torrent):
                 output.put_row(
                     [
@@ -0,0 +1,69 @@
+from html import escape
+
+from pywebio import input, output, session, config
+
+from ..common import trace
+from ..logger import logger
+from .common import generate_header, catcher
+
+TAG = "Web_Trace"
+
+colors = {
+    "fetch page": "#1f77b4",
+    "fetch torrent": "#17becf",
+    "transmission connect": "#ff7f0e",
+    "transmission add": "#ff7f0e",
+    "webhook": "#9467bd",
+    "db": "#2ca02c",
+}
+
+
+def _color(span: trace.Span):
+    if span.error:
+        return "#d62728"
+    if span.name.startswith("wait"):
+        return "#7f7f7f"
+    return colors.get(span.name, "#bcbd22")
+
+
+def waterfall(root: trace.Span):
+    total = max(root.seconds, 1e-6)
+    rows = []
+    for depth, span in root.walk():
+        left = (span.start - root.start) / total * 100
+        width = max(span.seconds / total * 100, 0.2)
+        attrs = " ".join(f"{k}={v}" for k, v in span.attrs.items())
+        if span.error:
+            attrs = f"{attrs} error={span.error}"
+        rows.append(
+            "<tr>"
+            f'<td style="padding-left: {depth}em; white-space: nowrap">{escape(span.name)}'
+            f' <small style="color: grey">{escape(attrs)}</small></td>'
+            f'<td style="text-align: right; white-space: nowrap">{span.seconds:.3f}s</td>'
+            '<td style="width: 50%"><div style="position: relative; height: 1em">'
+            f'<div style="position: absolute; left: {left:.2f}%; width: {width:.2f}%; height: 100%;'
+            f' background: {_color(span)}"></div></div></td>'
+            "</tr>")
+    return f'<table style="width: 100%; font-size: 0.8em">{"".join(rows)}</table>'
+
+
+@config(title="Trans RSS trace", theme="dark")
+@catcher
+async def trace_page():
+    generate_header()
+    roots = trace.traces()
+    if not roots:
+        output.put_text("还没有记录，更新订阅或发送通知后再查看")
+        return
+    index = await input.select(
+        "选择记录",
+        [{
+            "label": f"{root.start_time:%Y-%m-%d %H:%M:%S} {root.name} {root.seconds:.2f}s"
+                     f"{' 出错' if root.error else ''}",
+            "value": i
+        } for i, root in enumerate(roots)])
+    root = roots[index]
+    logger.debug(TAG, f"trace_page {root.name} {root.start_time}")
+    session.set_env(title=f"Trans RSS trace {root.start_time:%Y-%m-%d %H:%M:%S}")
+    output.put_text(" ".join(f"{k}={v}" for k, v in root.attrs.items()))
+    output.put_html(waterfall(root))
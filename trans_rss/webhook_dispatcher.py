@@ -0,0 +1,153 @@
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, List, Set, Tuple
+
+from . import webhook_types
+from .common import http_client, metrics, trace
+from .common.toast_message import emit_message
+from .config import Webhook, config
+from .logger import logger
+from .sql import Connection, WebhookMessage
+
+TAG = "WebhookDispatcher"
+
+_wake = threading.Event()
+_thread: threading.Thread = None
+# the endpoints are served separately, a slow one does not delay the others
+_pool = ThreadPoolExecutor(4, thread_name_prefix="webhook")
+# the last delivery time of each webhook url
+_last_sent: Dict[str, float] = {}
+_lock = threading.Lock()
+# the urls being sent in the pool, and the monotonic time to check the others again
+_busy: Set[str] = set()
+_check_at: Dict[str, float] = {}
+
+
+def deliver(webhook_type: str, url: str, body: bytes) -> Tuple[bool, str]:
+    """
+    post one message, return whether it succeeded and the response or the error
+    """
+    try:
+        with trace.span("webhook", type=webhook_type, url=url), metrics.WEBHOOK_SECONDS.time(type=webhook_type):
+            resp = http_client.post(
+                url, headers={'Content-Type': 'application/json'}, data=body)
+        if 200 <= resp.status_code <= 299:
+            logger.info(
+                TAG, f"deliver success {webhook_type} {url} {resp.status_code}")
+            metrics.WEBHOOK_DELIVERIES.inc(type=webhook_type, result="success")
+            return True, resp.text
+        logger.info(
+            TAG, f"deliver failed {webhook_type} {url} {resp.status_code} {body}")
+        metrics.WEBHOOK_DELIVERIES.inc(type=webhook_type, result="failed")
+        return False, f"{resp.status_code} {resp.text}"
+    except Exception as e:
+        logger.exception(
+            TAG, f"deliver exception {webhook_type} {url} {body}")
+        metrics.WEBHOOK_DELIVERIES.inc(type=webhook_type, result="error")
+        return False, str(e)
+
+
+def enqueue(title: str, desc: str, link: str, webhooks: List[Webhook] = None):
+    """
+    queue the message for every enabled webhook, the dispatcher thread will send them
+    """
+    messages = []
+    for webhook in config.webhooks if webhooks is None else webhooks:
+        if not webhook.enabled:
+            continue
+        body = webhook_types.format(webhook.type, title, desc, link)
+        messages.append(WebhookMessage(
+            type=webhook.type, url=webhook.url, body=body.decode(),
+            next_try=datetime.now()))
+    if messages:
+        with Connection() as conn:
+            conn.webhook_queue_add(messages)
+        _wake.set()
+
+
+def _dispatch_url(messages: List[WebhookMessage]) -> float:
+    """
+    send the due messages of one url in order, return the seconds until it should be checked again
+    """
+    wait = config.webhook_poll_seconds
+    for message in messages:
+        ready = _last_sent.get(message.url, 0) + config.webhook_interval
+        if ready > time.monotonic():  # rate limited
+            with trace.span("wait interval", url=message.url):
+                time.sleep(max(ready - time.monotonic(), 0))
+        _last_sent[message.url] = time.monotonic()
+        success, msg = deliver(message.type, message.url, message.body.encode())
+        with Connection() as conn:
+            if success:
+                conn.webhook_queue_del(message.id)
+            elif message.tries + 1 >= config.webhook_retries:
+                logger.error(
+                    TAG, f"drop after {message.tries + 1} tries {message.type} {message.url} {message.body}")
+                emit_message(f"通知{message.url}失败，{msg}", 30, color="error")
+                conn.webhook_queue_del(message.id)
+            else:
+                delay = config.webhook_retry_seconds * 2 ** message.tries
+                conn.webhook_queue_retry(
+                    message.id, message.tries + 1,
+                    datetime.now() + timedelta(seconds=delay))
+                # keep the order, webhook_queue_due holds back the later ones until the retry
+                return min(wait, delay)
+    return wait
+
+
+def _dispatch_group(url: str, group: List[WebhookMessage]):
+    try:
+        with trace.trace("webhooks", url=url, messages=len(group)):
+            wait = _dispatch_url(group)
+    except Exception:
+        logger.exception(TAG, f"dispatch failed {url}")
+        wait = config.webhook_poll_seconds
+    with _lock:
+        _busy.discard(url)
+        _check_at[url] = time.monotonic() + wait
+    _wake.set()  # the later messages of the url, or a retry
+
+
+def _dispatch_once() -> float:
+    """
+    start sending the due messages of the urls not being sent, each url in its own thread
+    so a slow endpoint does not delay the others. return the seconds until the next check
+    """
+    with Connection() as conn:
+        messages = list(conn.webhook_queue_due(datetime.now()))
+    groups: Dict[str, List[WebhookMessage]] = {}
+    for message in messages:
+        groups.setdefault(message.url, []).append(message)
+    now = time.monotonic()
+    with _lock:
+        for url, group in groups.items():
+            if url in _busy:  # picked up again when it finishes
+                continue
+            _busy.add(url)
+            _check_at.pop(url, None)
+            _pool.submit(contextvars.copy_context().run, _dispatch_group, url, group)
+        for url, at in list(_check_at.items()):
+            if at <= now:
+                del _check_at[url]
+        wait = min([config.webhook_poll_seconds, *(at - now for at in _check_at.values())])
+    return max(wait, 0)
+
+
+def start():
+    def dispatcher():
+        while True:
+            try:
+                wait = _dispatch_once()
+            except Exception:
+                logger.exception(TAG, "dispatch failed")
+                wait = config.webhook_poll_seconds
+            _wake.wait(wait)
+            _wake.clear()
+
+    global _thread
+    if _thread is None:
+        _thread = threading.Thread(target=dispatcher, daemon=True)
+        _thread.start()
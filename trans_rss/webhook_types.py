@@ -1,12 +1,12 @@
 
-from functools import cached_property
 import json
 from pathlib import Path
 from string import Template
 from typing import Dict
 
-from pydantic import BaseModel, BaseConfig
+from pydantic import BaseModel
 
+from .common import cache
 from .config import webhook_dir, webhook_builtin_dir
 
 
@@ -15,25 +15,22 @@ class WebhookType(BaseModel):
     body: dict = {}
     help: str = ""
 
-    @cached_property
+    @property
     def template(self):
         return Template(json.dumps(self.body, ensure_ascii=False))
 
     def dumps_indent(self):
         return json.dumps(self.body, indent=4, ensure_ascii=False)
-    
-    def format(self, d: dict):
-        return self.template.safe_substitute(d)
-
-    class Config(BaseConfig):
-        keep_untouched = BaseConfig.keep_untouched + (cached_property, )
 
 
 _webhook_types: Dict[str, WebhookType] = {}
+# compiled from the bodies when first used
+_templates: "cache.Cache[Template]" = cache.create("webhook_templates", 32)
 
 
 def init():
     _webhook_types.clear()
+    _templates.clear()
 
     def load_from(dir: Path, builtin: bool):
         for path in dir.glob("*.json"):
@@ -43,11 +40,12 @@ def init():
 
 
 def format(type: str, title: str, sub: str, torrent: str):
-    return _webhook_types.get(type).format(dict(
-        title=title,
-        subscribe=sub,
-        torrent=torrent
-    )).encode()
+    template = _templates.get_or_set(type, lambda: _webhook_types[type].template)
+    # the placeholders are inside json strings, escape quotes and new lines of the values
+    return template.safe_substitute({
+        k: json.dumps(v, ensure_ascii=False)[1:-1]
+        for k, v in dict(title=title, subscribe=sub, torrent=torrent).items()
+    }).encode()
 
 
 def get(type: str):
@@ -56,14 +54,17 @@ def get(type: str):
 
 def _try_add_from_file(file: Path, builtin: bool):
     if file.exists():
-        wt = _webhook_types[file.name.removesuffix(".json")] = WebhookType.parse_file(file)
+        type = file.name.removesuffix(".json")
+        wt = _webhook_types[type] = WebhookType.parse_file(file)
         wt.builtin = builtin
+        _templates.pop(type)
 
 
 def add(type: str, webhook: WebhookType):
     with (webhook_dir / f"{type}.json").open('w', encoding='utf-8') as w:
         json.dump(webhook.dict(), w, ensure_ascii=False, indent=4)
     _webhook_types[type] = webhook
+    _templates.pop(type)
 
 
 def list():
@@ -73,6 +74,7 @@ def list():
 def remove(type: str):
     (webhook_dir / f"{type}.json").unlink(True)
     del _webhook_types[type]
+    _templates.pop(type)
     _try_add_from_file(webhook_builtin_dir / f"{type}.json", True)
 
 init()
\ No newline at end of file